@@ -0,0 +1,92 @@
+"""
+LLM Response Extraction
+
+LLM响应内容提取 - 按结果类型缓存提取函数，避免每次响应都重复hasattr探测
+"""
+
+from typing import Any, Callable, Dict, Optional
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# 结果类型 -> 提取函数，首次见到某个类型时解析一次
+_EXTRACTORS: Dict[type, Callable[[Any], str]] = {}
+
+
+def _extract_from_generations(llm_result) -> str:
+    """LangChain标准格式"""
+    if not llm_result.generations:
+        return str(llm_result)
+    return llm_result.generations[0][0].text
+
+
+def _content_text(content) -> Optional[str]:
+    """把content转为文本：字符串原样返回，内容块列表拼接其中的文本块，无法识别时返回None"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            if isinstance(block, str):
+                parts.append(block)
+            elif isinstance(block, dict):
+                if block.get("type", "text") == "text" and isinstance(block.get("text"), str):
+                    parts.append(block["text"])
+            elif isinstance(getattr(block, 'text', None), str):
+                parts.append(block.text)
+        return "".join(parts)
+    return None
+
+
+def _extract_from_content(llm_result) -> str:
+    """直接包含content属性（字符串或内容块列表）"""
+    text = _content_text(llm_result.content)
+    return text if text is not None else str(llm_result.content)
+
+
+def _extract_from_text(llm_result) -> str:
+    """直接包含text属性"""
+    return llm_result.text
+
+
+def _resolve_extractor(llm_result) -> Callable[[Any], str]:
+    """根据结果实例的属性确定其类型对应的提取函数并缓存"""
+
+    if hasattr(llm_result, 'generations'):
+        extractor = _extract_from_generations
+    elif hasattr(llm_result, 'content'):
+        extractor = _extract_from_content
+    elif hasattr(llm_result, 'text'):
+        extractor = _extract_from_text
+    else:
+        # 降级处理
+        extractor = str
+
+    _EXTRACTORS[type(llm_result)] = extractor
+    return extractor
+
+
+def extract_llm_response(llm_result) -> str:
+    """从LLM结果中提取响应内容"""
+
+    extractor = _EXTRACTORS.get(type(llm_result)) or _resolve_extractor(llm_result)
+
+    try:
+        return extractor(llm_result)
+    except Exception as e:
+        logger.error(f"提取LLM响应失败: {e}")
+        return str(llm_result)
+
+
+def extract_chunk_text(chunk) -> str:
+    """从流式chunk中提取文本，无法识别的chunk返回空字符串"""
+
+    if isinstance(chunk, str):
+        return chunk
+
+    text = _content_text(getattr(chunk, 'content', None))
+    if text is not None:
+        return text
+
+    text = getattr(chunk, 'text', None)
+    return text if isinstance(text, str) else ""
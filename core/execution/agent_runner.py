@@ -5,7 +5,11 @@ Agent运行引擎 - 管理单轮Agent推理和执行
 """
 
 import asyncio
-from typing import Dict, List, Optional, Any, AsyncGenerator
+import json
+import posixpath
+import re
+import time
+from typing import Dict, List, Optional, Any, AsyncGenerator, Tuple
 from dataclasses import dataclass
 import structlog
 
@@ -14,18 +18,19 @@ from tools.llm.llm_manager import LLMManager
 from core.prompt_manager import create_prompt_manager, create_build_request
 from models.base import ExecutionState
 
+from ._llm_response import extract_chunk_text, extract_llm_response
 from .role_executor import AgentEnvironment, IterationResult
 
 logger = structlog.get_logger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class ToolCall:
     """工具调用"""
     name: str
     arguments: Dict[str, Any]
     description: str
 
-@dataclass
+@dataclass(slots=True)
 class ToolResult:
     """工具执行结果"""
     tool_call: ToolCall
@@ -33,8 +38,9 @@ class ToolResult:
     output: Optional[Any] = None
     error: Optional[str] = None
     execution_time: float = 0.0
+    terminate: bool = False  # 工具在metadata中声明可以结束执行
 
-@dataclass
+@dataclass(slots=True)
 class CompletionAnalysis:
     """完成状态分析"""
     is_completed: bool
@@ -43,17 +49,280 @@ class CompletionAnalysis:
     next_actions: List[str]
     quality_indicators: Dict[str, Any]
 
+@dataclass(slots=True)
+class ToolStatsDelta:
+    """单批工具执行的统计增量"""
+    total_calls: int = 0
+    successful_calls: int = 0
+    total_execution_time: float = 0.0
+    tools_bitmap: int = 0
+
+_JSON_DECODER = json.JSONDecoder()
+
+# 完成信号：单个预编译的交替正则，每个工具输出只扫描一遍
+_COMPLETION_RE = re.compile(r"完成|finished|done|任务结束", re.IGNORECASE)
+
+def _to_tool_call(tool_data: Any) -> Optional[ToolCall]:
+    """将解析出的JSON对象转换为工具调用"""
+    
+    if not isinstance(tool_data, dict) or "tool_name" not in tool_data:
+        return None
+    
+    return ToolCall(
+        name=tool_data["tool_name"],
+        arguments=tool_data.get("parameters", tool_data.get("arguments", {})),
+        description=tool_data.get("description", f"执行工具: {tool_data['tool_name']}")
+    )
+
+def _collect_tool_calls(value: Any, tool_calls: List[ToolCall]):
+    """在已解码的JSON值中按文档顺序收集工具调用，工具调用对象本身不再向内查找"""
+    
+    tool_call = _to_tool_call(value)
+    if tool_call:
+        tool_calls.append(tool_call)
+    elif isinstance(value, dict):
+        for item in value.values():
+            if isinstance(item, (dict, list)):
+                _collect_tool_calls(item, tool_calls)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)):
+                _collect_tool_calls(item, tool_calls)
+
+def _should_terminate(tool_results: List[ToolResult]) -> bool:
+    """所有成功的工具结果都声明terminate时提示结束执行"""
+    
+    successful = [result for result in tool_results if result.success]
+    return bool(successful) and all(result.terminate for result in successful)
+
+def _tool_call_key(name: str, arguments: Dict[str, Any]) -> tuple:
+    """工具调用去重键，参数值不可哈希时退化为排序后的JSON"""
+    
+    try:
+        return (name, frozenset(arguments.items()))
+    except TypeError:
+        return (name, json.dumps(arguments, sort_keys=True, default=str))
+
+# 标识工具所操作资源的参数名：路径参数按目录层级判断冲突，URL按原值判断
+_PATH_ARGUMENT_KEYS = ("file_path", "path", "directory")
+_URL_ARGUMENT_KEYS = ("url",)
+
+def _tool_call_resources(tool_call: ToolCall) -> Optional[frozenset]:
+    """工具调用操作的资源集合（(类型, 值)），路径已规范化，无法判断时返回None"""
+    
+    arguments = tool_call.arguments
+    if not isinstance(arguments, dict):
+        return None
+    
+    resources = frozenset(
+        [("path", posixpath.normpath(str(arguments[key]))) for key in _PATH_ARGUMENT_KEYS if arguments.get(key)]
+        + [("url", str(arguments[key])) for key in _URL_ARGUMENT_KEYS if arguments.get(key)]
+    )
+    return resources or None
+
+def _resource_scopes(resource: Tuple[str, str]) -> List[Tuple[str, str]]:
+    """资源自身及其所有上级目录，URL没有上级"""
+    
+    kind, value = resource
+    if kind != "path":
+        return [resource]
+    
+    scopes = [resource]
+    parent = posixpath.dirname(value)
+    while parent and parent != value:
+        scopes.append((kind, parent))
+        value, parent = parent, posixpath.dirname(parent)
+    return scopes
+
+def _schedule_tool_waves(tool_calls: List[ToolCall], indices: List[int]) -> List[List[int]]:
+    """按资源冲突把非并发安全的工具调用分层
+    
+    操作同一资源、或路径互为上下级（如目录/a与文件/a/b）的调用按出现顺序依赖，
+    资源未知的调用与前后所有调用都有依赖。依赖边只从先出现的调用指向后出现的调用，
+    因此按出现顺序一次遍历即可求得每个调用所在的拓扑层（最长依赖路径），
+    同层调用之间互不冲突，可以并发执行。
+    """
+    
+    waves: List[List[int]] = []
+    resource_level: Dict[Tuple[str, str], int] = {}  # 资源 -> 最近一次操作它的调用所在层
+    subtree_level: Dict[Tuple[str, str], int] = {}  # 目录 -> 其下（含自身）资源所在的最高层
+    barrier = -1  # 最近一个资源未知的调用所在层
+    
+    for index in indices:
+        resources = _tool_call_resources(tool_calls[index])
+        
+        if resources is None:
+            level = len(waves)
+            barrier = level
+        else:
+            scopes = [_resource_scopes(resource) for resource in resources]
+            level = barrier
+            for resource, resource_scopes in zip(resources, scopes):
+                level = max(level, subtree_level.get(resource, -1),
+                            *(resource_level.get(scope, -1) for scope in resource_scopes))
+            level += 1
+            for resource, resource_scopes in zip(resources, scopes):
+                resource_level[resource] = level
+                for scope in resource_scopes:
+                    subtree_level[scope] = max(subtree_level.get(scope, -1), level)
+        
+        if level == len(waves):
+            waves.append([])
+        waves[level].append(index)
+    
+    return waves
+
+def _scan_tool_calls(text: str, position: int, tool_calls: List[ToolCall], final: bool = True) -> int:
+    """从position处的"{"开始依次解码JSON对象并收集工具调用，返回下一个待解码的位置
+    
+    用str.find定位候选的"{"，再由json的C扫描器raw_decode直接解析出完整对象，
+    无需正则回溯。解析成功的对象在解码结果上查找嵌套的工具调用，随后整体跳过；
+    解析失败时前进到下一个"{"。final为False时文本可能尚未结束，因文本不完整而失败的
+    对象停在原位等待更多输入，返回其起始位置。
+    """
+    
+    while position != -1:
+        try:
+            tool_data, end = _JSON_DECODER.raw_decode(text, position)
+        except json.JSONDecodeError as e:
+            if not final and (e.pos >= len(text) or e.msg.startswith("Unterminated string")):
+                return position
+            end = position + 1
+        else:
+            _collect_tool_calls(tool_data, tool_calls)
+        
+        position = text.find("{", end)
+    
+    return len(text)
+
+class _StreamStartError(Exception):
+    """流式调用在收到第一个chunk之前失败，可以安全地改用ainvoke"""
+
+class StreamingToolCallParser:
+    """流式工具调用解析器 - 与_parse_structured_tool_calls使用相同的解码规则，对象闭合即产出工具调用
+    
+    只对缓冲文本中最后一个"}"之前的部分尝试解码，末尾不会是被截断的字面量，
+    因此解码失败时可以区分"文本不完整"和"不是合法JSON"：后者（如正文中不成对的"{"）
+    立即跳到下一个"{"，不会阻塞之后工具调用的提前派发。
+    """
+    
+    def __init__(self):
+        self._text = ""
+        self._position = -1  # 下一个待解码的"{"在_text中的位置，-1表示尚未出现
+    
+    def feed(self, text: str) -> List[ToolCall]:
+        """输入一段流式文本，返回其中已闭合的工具调用"""
+        
+        if self._position == -1:
+            # 尚无候选对象时只缓存从第一个"{"开始的文本
+            start = text.find("{")
+            if start == -1:
+                return []
+            self._text = text[start:]
+            self._position = 0
+        else:
+            self._text += text
+        
+        if "}" not in text:
+            return []
+        
+        tool_calls = []
+        complete = self._text[:self._text.rfind("}") + 1]
+        position = _scan_tool_calls(complete, self._position, tool_calls, final=False)
+        self._consume(position)
+        
+        return tool_calls
+    
+    def finish(self) -> List[ToolCall]:
+        """流结束时按完整文本的规则解析剩余部分，返回其中的工具调用"""
+        
+        tool_calls = []
+        if self._position != -1:
+            _scan_tool_calls(self._text, self._position, tool_calls)
+        
+        self._text = ""
+        self._position = -1
+        return tool_calls
+    
+    def _consume(self, position: int):
+        """丢弃position之前已处理的文本"""
+        
+        position = self._text.find("{", position)
+        if position == -1:
+            self._text = ""
+            self._position = -1
+        else:
+            self._text = self._text[position:]
+            self._position = 0
+
+class ToolKeywordMatcher:
+    """工具关键词匹配器 - 所有工具的关键词编译为一个正则，响应文本只扫描一遍"""
+    
+    def __init__(self, tool_names: List[str]):
+        self.tool_names = tool_names
+        self._tool_keywords = [(name, self._keywords_for(name)) for name in tool_names]
+        
+        all_keywords = set().union(*(keywords for _, keywords in self._tool_keywords))
+        
+        # 每个位置只记录最长的命中关键词，其子串关键词视为同时命中
+        self._implied = {
+            keyword: frozenset(other for other in all_keywords if other in keyword)
+            for keyword in all_keywords
+        }
+        
+        alternation = "|".join(re.escape(keyword) for keyword in sorted(all_keywords, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alternation}))", re.IGNORECASE) if all_keywords else None
+    
+    @staticmethod
+    def _keywords_for(tool_name: str) -> frozenset:
+        """工具名称及相关关键词（小写）"""
+        
+        tool_lower = tool_name.lower()
+        keywords = [tool_lower, tool_lower.replace("_", " ")]
+        
+        # 添加特定工具的关键词
+        if "file" in tool_lower:
+            keywords.extend(["文件", "读取", "写入", "file", "read", "write"])
+        elif "code" in tool_lower:
+            keywords.extend(["代码", "分析", "code", "analyze"])
+        elif "text" in tool_lower:
+            keywords.extend(["文本", "处理", "text", "process"])
+        elif "data" in tool_lower:
+            keywords.extend(["数据", "验证", "data", "validate"])
+        
+        return frozenset(keyword for keyword in keywords if keyword)
+    
+    def match(self, text: str) -> List[str]:
+        """返回文本中命中关键词的工具名称（保持工具列表顺序）"""
+        
+        if self._pattern is None:
+            return []
+        
+        found = set()
+        for match in self._pattern.finditer(text):
+            found.update(self._implied.get(match.group(1).lower(), ()))
+        
+        return [name for name, keywords in self._tool_keywords if not keywords.isdisjoint(found)]
+
 class AgentRunner:
     """Agent运行引擎 - 管理单轮Agent推理和执行"""
     
-    def __init__(self):
+    def __init__(self, use_streaming: bool = True):
         # LLM实例
         from tools.llm import get_llm_for_scene
         self.llm = get_llm_for_scene("sub_agent")
         
+        # 是否流式调用LLM，LLM不支持astream时始终使用ainvoke
+        self.use_streaming = use_streaming
+        
         # 工具管理器
         self.tool_manager = get_tool_manager()
         
+        # 可用工具缓存（获取时间, 工具名列表, 工具名 -> 是否并发安全），会话内工具集很少变化
+        self._tools_cache: Optional[Tuple[float, List[str], Dict[str, bool]]] = None
+        self._tools_cache_ttl = 5.0
+        self._tool_matcher: Optional[ToolKeywordMatcher] = None
+        
         # 使用独立的prompt管理器
         self.prompt_manager = create_prompt_manager()
         
@@ -62,9 +331,12 @@ class AgentRunner:
             "total_calls": 0,
             "successful_calls": 0,
             "failed_calls": 0,
-            "total_execution_time": 0.0,
-            "tools_used": set()
+            "total_execution_time": 0.0
         }
+        
+        # 已使用工具位图（工具名 -> 位索引，按首次出现分配）
+        self._tool_index: Dict[str, int] = {}
+        self._tools_bitmap: int = 0
     
     async def run_iteration(self, agent_env: AgentEnvironment, iteration: int) -> IterationResult:
         """运行一轮Agent推理"""
@@ -75,17 +347,33 @@ class AgentRunner:
             # 使用独立prompt管理器构建完整提示词
             full_prompt = await self._build_prompt_with_manager(agent_env, iteration)
             
-            # 异步调用LLM
-            llm_result = await self.llm.ainvoke(full_prompt)
-            
-            # 提取响应内容
-            llm_response = self._extract_llm_response(llm_result)
+            streamed = False
+            if self.use_streaming and hasattr(self.llm, 'astream'):
+                # 流式调用LLM，生成过程中即派发已解析完成的工具调用
+                try:
+                    llm_response, tool_calls, tool_results = await self._run_streaming(full_prompt, agent_env)
+                    streamed = True
+                except _StreamStartError as e:
+                    # 只有尚未收到任何输出时才改用ainvoke，之后的失败不再重复调用LLM和工具
+                    logger.warning(f"流式调用LLM失败，改用ainvoke: {e}")
+            
+            if not streamed:
+                # 异步调用LLM
+                llm_result = await self.llm.ainvoke(full_prompt)
+                
+                # 提取响应内容
+                llm_response = extract_llm_response(llm_result)
+                tool_calls, tool_results = [], []
             
-            # 3. 解析LLM响应，提取工具调用
-            tool_calls = await self._parse_tool_calls(llm_response)
+            if not tool_calls:
+                # 3. 解析LLM响应，提取工具调用
+                tool_calls = await self._parse_tool_calls(llm_response)
+                
+                # 4. 并行执行工具调用
+                tool_results = await self._execute_tools_parallel(tool_calls, agent_env)
             
-            # 4. 并行执行工具调用
-            tool_results = await self._execute_tools_parallel(tool_calls, agent_env)
+            # 工具结果提示结束时，由执行控制器在下一次检查时直接停止
+            agent_env.terminate_hint = _should_terminate(tool_results)
             
             # 5. 分析执行结果，判断是否完成
             completion_analysis = await self._analyze_completion(tool_results, agent_env)
@@ -109,6 +397,23 @@ class AgentRunner:
             logger.error(f"Agent迭代 {iteration} 执行失败: {e}")
             return await self._handle_iteration_error(iteration, e)
     
+    async def run_iterations(self, agent_envs: List[AgentEnvironment], iteration: int) -> List[IterationResult]:
+        """批量运行多个Agent环境的同一轮推理
+        
+        各环境的prompt构建、LLM请求、工具执行和完成分析并发进行，
+        N个LLM请求共享一次事件循环等待，服务端可对其连续批处理。
+        """
+        
+        if not agent_envs:
+            return []
+        
+        logger.info(f"开始批量执行第 {iteration} 轮Agent推理，环境数: {len(agent_envs)}")
+        
+        # run_iteration内部已捕获异常并转换为错误结果，gather不会因单个失败中断
+        return list(await asyncio.gather(
+            *(self.run_iteration(agent_env, iteration) for agent_env in agent_envs)
+        ))
+    
     async def _build_prompt_with_manager(self, agent_env: AgentEnvironment, iteration: int) -> str:
         """使用独立prompt管理器构建完整提示词"""
         
@@ -144,32 +449,70 @@ class AgentRunner:
             raise Exception(f"使用prompt管理器构建prompt失败: {e}")
             
     
-    def _extract_llm_response(self, llm_result) -> str:
-        """从LLM结果中提取响应内容"""
+    async def _run_streaming(self, full_prompt: str, agent_env: AgentEnvironment):
+        """流式调用LLM，使工具执行与生成重叠
+        
+        并发安全的工具在其JSON闭合时立即开始执行；其余工具在流结束后按资源依赖分层执行，
+        操作不同资源的调用可以并发。收到第一个chunk之前的失败抛出_StreamStartError，
+        此后的失败原样抛出，避免重复调用LLM、重复执行已开始的工具。
+        """
         
+        concurrency_safety = await self._get_tool_concurrency_safety()
+        
+        parser = StreamingToolCallParser()
+        response_parts = []
+        tool_calls = []
+        pending_tasks: Dict[int, asyncio.Task] = {}
+        
+        def dispatch(parsed_calls: List[ToolCall]):
+            for tool_call in parsed_calls:
+                logger.debug(f"流式解析到工具调用: {tool_call.name}")
+                if concurrency_safety.get(tool_call.name, False):
+                    pending_tasks[len(tool_calls)] = asyncio.create_task(
+                        self._execute_single_tool(tool_call, agent_env)
+                    )
+                tool_calls.append(tool_call)
+        
+        started = False
         try:
-            # 尝试从不同格式的结果中提取内容
-            if hasattr(llm_result, 'generations') and llm_result.generations:
-                # LangChain标准格式
-                generation = llm_result.generations[0][0]
-                if hasattr(generation, 'text'):
-                    return generation.text
-            
-            elif hasattr(llm_result, 'content'):
-                # 直接包含content属性
-                return llm_result.content
-            
-            elif hasattr(llm_result, 'text'):
-                # 直接包含text属性
-                return llm_result.text
-            
-            else:
-                # 降级处理
-                return str(llm_result)
-                
-        except Exception as e:
-            logger.error(f"提取LLM响应失败: {e}")
-            return str(llm_result)
+            async for chunk in self.llm.astream(full_prompt):
+                started = True
+                text = extract_chunk_text(chunk)
+                response_parts.append(text)
+                dispatch(parser.feed(text))
+            
+            dispatch(parser.finish())
+        except BaseException as e:
+            for task in pending_tasks.values():
+                task.cancel()
+            if not started and isinstance(e, Exception):
+                raise _StreamStartError(str(e)) from e
+            raise
+        
+        if not tool_calls:
+            return "".join(response_parts), tool_calls, []
+        
+        tool_results: List[Optional[ToolResult]] = [None] * len(tool_calls)
+        
+        if pending_tasks:
+            results = await asyncio.gather(*pending_tasks.values(), return_exceptions=True)
+            for index, result in zip(pending_tasks, results):
+                tool_results[index] = self._to_tool_result(tool_calls[index], result)
+        
+        # 非并发安全的工具在生成结束后按资源依赖分层执行，同层并发
+        remaining = [index for index in range(len(tool_calls)) if index not in pending_tasks]
+        for wave in _schedule_tool_waves(tool_calls, remaining):
+            wave_results = await asyncio.gather(
+                *(self._execute_single_tool(tool_calls[index], agent_env) for index in wave),
+                return_exceptions=True
+            )
+            for index, result in zip(wave, wave_results):
+                tool_results[index] = self._to_tool_result(tool_calls[index], result)
+        
+        delta = self._update_tool_execution_stats(tool_results)
+        logger.info(f"流式工具执行完成，成功: {delta.successful_calls}/{delta.total_calls}")
+        
+        return "".join(response_parts), tool_calls, tool_results
     
     async def _parse_tool_calls(self, llm_response: str) -> List[ToolCall]:
         """解析LLM响应，提取工具调用"""
@@ -195,87 +538,76 @@ class AgentRunner:
     
     async def _parse_structured_tool_calls(self, llm_response: str) -> List[ToolCall]:
         """解析结构化的工具调用（JSON格式）"""
-        import json
-        import re
         
         tool_calls = []
-        
-        # 查找JSON格式的工具调用
-        json_pattern = r'```json\s*(\{.*?\})\s*```|```\s*(\{.*?\})\s*```|\{[^{}]*"tool_name"[^{}]*\}'
-        matches = re.findall(json_pattern, llm_response, re.DOTALL | re.IGNORECASE)
-        
-        for match in matches:
-            try:
-                # match可能是元组，取非空的部分
-                json_str = match[0] if match[0] else (match[1] if len(match) > 1 and match[1] else match)
-                if isinstance(json_str, tuple):
-                    json_str = next((item for item in json_str if item), "")
-                
-                if not json_str:
-                    continue
-                    
-                tool_data = json.loads(json_str)
-                
-                if isinstance(tool_data, dict) and "tool_name" in tool_data:
-                    tool_calls.append(ToolCall(
-                        name=tool_data["tool_name"],
-                        arguments=tool_data.get("parameters", tool_data.get("arguments", {})),
-                        description=tool_data.get("description", f"执行工具: {tool_data['tool_name']}")
-                    ))
-                elif isinstance(tool_data, list):
-                    for item in tool_data:
-                        if isinstance(item, dict) and "tool_name" in item:
-                            tool_calls.append(ToolCall(
-                                name=item["tool_name"],
-                                arguments=item.get("parameters", item.get("arguments", {})),
-                                description=item.get("description", f"执行工具: {item['tool_name']}")
-                            ))
-                            
-            except json.JSONDecodeError:
-                continue
-        
+        _scan_tool_calls(llm_response, llm_response.find("{"), tool_calls)
         return tool_calls
     
     async def _parse_natural_language_tool_calls(self, llm_response: str) -> List[ToolCall]:
         """解析自然语言中的工具调用"""
         tool_calls = []
+        seen_calls = set()
         
         # 获取可用工具列表进行智能匹配
-        tools_info = await self.tool_manager.get_available_tools()
-        available_tools = [tool["name"] for tool in tools_info]
+        available_tools = await self._get_available_tool_names()
         
-        # 基于可用工具进行智能匹配
-        response_lower = llm_response.lower()
+        # 基于可用工具进行智能匹配：所有关键词一次扫描
+        matcher = self._get_tool_keyword_matcher(available_tools)
         
-        for tool_name in available_tools:
-            tool_lower = tool_name.lower()
+        for tool_name in matcher.match(llm_response):
+            # 尝试提取参数（简单实现）
+            arguments = self._extract_tool_arguments(llm_response, tool_name)
             
-            # 检查工具名称或相关关键词
-            keywords = [tool_lower, tool_lower.replace("_", " ")]
-            
-            # 添加特定工具的关键词
-            if "file" in tool_lower:
-                keywords.extend(["文件", "读取", "写入", "file", "read", "write"])
-            elif "code" in tool_lower:
-                keywords.extend(["代码", "分析", "code", "analyze"])
-            elif "text" in tool_lower:
-                keywords.extend(["文本", "处理", "text", "process"])
-            elif "data" in tool_lower:
-                keywords.extend(["数据", "验证", "data", "validate"])
+            # 相同工具+相同参数只执行一次
+            call_key = _tool_call_key(tool_name, arguments)
+            if call_key in seen_calls:
+                continue
+            seen_calls.add(call_key)
             
-            # 检查是否匹配
-            if any(keyword in response_lower for keyword in keywords):
-                # 尝试提取参数（简单实现）
-                arguments = self._extract_tool_arguments(llm_response, tool_name)
-                
-                tool_calls.append(ToolCall(
-                    name=tool_name,
-                    arguments=arguments,
-                    description=f"基于自然语言解析的工具调用: {tool_name}"
-                ))
+            tool_calls.append(ToolCall(
+                name=tool_name,
+                arguments=arguments,
+                description=f"基于自然语言解析的工具调用: {tool_name}"
+            ))
         
         return tool_calls
     
+    def _get_tool_keyword_matcher(self, available_tools: List[str]) -> ToolKeywordMatcher:
+        """获取关键词匹配器，工具列表未变化时复用已编译的匹配器"""
+        
+        if self._tool_matcher is None or self._tool_matcher.tool_names is not available_tools:
+            self._tool_matcher = ToolKeywordMatcher(available_tools)
+        
+        return self._tool_matcher
+    
+    async def _get_available_tool_names(self) -> List[str]:
+        """获取可用工具名称，在TTL内复用上次结果"""
+        return (await self._get_tools_snapshot())[1]
+    
+    async def _get_tool_concurrency_safety(self) -> Dict[str, bool]:
+        """获取工具名 -> 是否并发安全，在TTL内复用上次结果"""
+        return (await self._get_tools_snapshot())[2]
+    
+    async def _get_tools_snapshot(self) -> Tuple[float, List[str], Dict[str, bool]]:
+        """获取并缓存可用工具信息快照"""
+        
+        now = time.monotonic()
+        if self._tools_cache and now - self._tools_cache[0] < self._tools_cache_ttl:
+            return self._tools_cache
+        
+        tools_info = await self.tool_manager.get_available_tools()
+        self._tools_cache = (
+            now,
+            [tool["name"] for tool in tools_info],
+            {tool["name"]: tool.get("is_concurrency_safe", False) for tool in tools_info}
+        )
+        
+        return self._tools_cache
+    
+    def invalidate_tools_cache(self):
+        """工具集变化时清除可用工具缓存"""
+        self._tools_cache = None
+    
     def _extract_tool_arguments(self, llm_response: str, tool_name: str) -> Dict[str, Any]:
         """从自然语言中提取工具参数（简单实现）"""
         arguments = {}
@@ -337,13 +669,14 @@ class AgentRunner:
         """通过工具管理器批量执行工具"""
         
         # 构建工具调用格式
-        batch_calls = []
-        for tool_call in tool_calls:
-            batch_calls.append({
+        batch_calls = [
+            {
                 "tool_name": tool_call.name,
                 "parameters": tool_call.arguments,
                 "description": tool_call.description
-            })
+            }
+            for tool_call in tool_calls
+        ]
         
         # 构建执行上下文
         context = {
@@ -356,42 +689,62 @@ class AgentRunner:
         tool_execution_results = await self.tool_manager.execute_tools_batch(batch_calls, context)
         
         # 转换结果格式
-        results = []
-        for i, (tool_call, execution_result) in enumerate(zip(tool_calls, tool_execution_results)):
-            results.append(ToolResult(
+        results = [
+            ToolResult(
                 tool_call=tool_call,
                 success=execution_result.success,
                 output=execution_result.result,
                 error=execution_result.error,
-                execution_time=execution_result.execution_time
-            ))
+                execution_time=execution_result.execution_time,
+                terminate=bool((getattr(execution_result, "metadata", None) or {}).get("terminate"))
+            )
+            for tool_call, execution_result in zip(tool_calls, tool_execution_results)
+        ]
         
         # 更新统计信息
-        self._update_tool_execution_stats(results)
+        delta = self._update_tool_execution_stats(results)
         
-        logger.info(f"批量工具执行完成，成功: {sum(1 for r in results if r.success)}/{len(results)}")
+        logger.info(f"批量工具执行完成，成功: {delta.successful_calls}/{delta.total_calls}")
         return results
     
     
     
-    def _update_tool_execution_stats(self, tool_results: List[ToolResult]):
-        """更新工具执行统计信息"""
+    def _update_tool_execution_stats(self, tool_results: List[ToolResult]) -> ToolStatsDelta:
+        """更新工具执行统计信息，返回本批增量
+        
+        先在本地一次遍历算出整批增量，再一次性合并到共享统计中；合并过程没有await，
+        并发的迭代任务之间不会交错写入。
+        """
+        
+        delta = self._collect_stats_delta(tool_results)
+        
+        stats = self.tool_execution_stats
+        stats["total_calls"] += delta.total_calls
+        stats["successful_calls"] += delta.successful_calls
+        stats["failed_calls"] += delta.total_calls - delta.successful_calls
+        stats["total_execution_time"] += delta.total_execution_time
+        self._tools_bitmap |= delta.tools_bitmap
+        
+        return delta
+    
+    def _collect_stats_delta(self, tool_results: List[ToolResult]) -> ToolStatsDelta:
+        """一次遍历计算一批工具结果的统计增量"""
+        
+        delta = ToolStatsDelta(total_calls=len(tool_results))
+        tool_index = self._tool_index
         
         for result in tool_results:
-            self.tool_execution_stats["total_calls"] += 1
-            self.tool_execution_stats["total_execution_time"] += result.execution_time
-            self.tool_execution_stats["tools_used"].add(result.tool_call.name)
-            
-            if result.success:
-                self.tool_execution_stats["successful_calls"] += 1
-            else:
-                self.tool_execution_stats["failed_calls"] += 1
+            delta.successful_calls += result.success
+            delta.total_execution_time += result.execution_time
+            delta.tools_bitmap |= 1 << tool_index.setdefault(result.tool_call.name, len(tool_index))
+        
+        return delta
     
     def get_tool_execution_stats(self) -> Dict[str, Any]:
         """获取工具执行统计信息"""
         
         stats = self.tool_execution_stats.copy()
-        stats["tools_used"] = list(stats["tools_used"])  # 转换为列表
+        stats["tools_used"] = self._get_tools_used()
         
         # 计算平均执行时间
         if stats["total_calls"] > 0:
@@ -410,52 +763,72 @@ class AgentRunner:
             "total_calls": 0,
             "successful_calls": 0,
             "failed_calls": 0,
-            "total_execution_time": 0.0,
-            "tools_used": set()
+            "total_execution_time": 0.0
         }
+        self._tools_bitmap = 0
+    
+    def _get_tools_used(self) -> List[str]:
+        """从位图还原已使用的工具列表"""
+        bitmap = self._tools_bitmap
+        return [name for name, index in self._tool_index.items() if bitmap >> index & 1]
+    
+    def _count_tools_used(self) -> int:
+        """已使用的工具数量"""
+        return self._tools_bitmap.bit_count()
     
     async def _execute_single_tool(self, tool_call: ToolCall, agent_env: AgentEnvironment) -> ToolResult:
-        """执行单个工具"""
+        """执行单个工具
         
-        start_time = asyncio.get_event_loop().time()
+        不在此处捕获异常：调用方通过 asyncio.gather(..., return_exceptions=True) 统一收集，
+        再由 _to_tool_result 转换为失败结果。
+        """
         
-        try:
-            logger.info(f"执行工具: {tool_call.name}")
-            
-            # 使用工具管理器执行工具
-            context = {
-                "agent_env": agent_env,
-                "iteration_context": getattr(agent_env, 'context', {}),
-                "available_tools": getattr(agent_env, 'available_tools', [])
-            }
-            
-            tool_execution_result = await self.tool_manager.execute_tool(
-                tool_name=tool_call.name,
-                parameters=tool_call.arguments,
-                context=context
-            )
-            
-            execution_time = asyncio.get_event_loop().time() - start_time
-            
-            # 转换为 AgentRunner 的 ToolResult 格式
-            return ToolResult(
-                tool_call=tool_call,
-                success=tool_execution_result.success,
-                output=tool_execution_result.result,
-                error=tool_execution_result.error,
-                execution_time=execution_time
-            )
-            
-        except Exception as e:
-            execution_time = asyncio.get_event_loop().time() - start_time
-            logger.error(f"工具 {tool_call.name} 执行失败: {e}")
-            
-            return ToolResult(
-                tool_call=tool_call,
-                success=False,
-                error=str(e),
-                execution_time=execution_time
-            )
+        start_time = time.perf_counter()
+        
+        logger.info(f"执行工具: {tool_call.name}")
+        
+        # 使用工具管理器执行工具
+        context = {
+            "agent_env": agent_env,
+            "iteration_context": getattr(agent_env, 'context', {}),
+            "available_tools": getattr(agent_env, 'available_tools', [])
+        }
+        
+        tool_execution_result = await self.tool_manager.execute_tool(
+            tool_name=tool_call.name,
+            parameters=tool_call.arguments,
+            context=context
+        )
+        
+        execution_time = time.perf_counter() - start_time
+        
+        # 转换为 AgentRunner 的 ToolResult 格式
+        return ToolResult(
+            tool_call=tool_call,
+            success=tool_execution_result.success,
+            output=tool_execution_result.result,
+            error=tool_execution_result.error,
+            execution_time=execution_time,
+            terminate=bool((getattr(tool_execution_result, "metadata", None) or {}).get("terminate"))
+        )
+    
+    @staticmethod
+    def _to_tool_result(tool_call: ToolCall, result: Any) -> ToolResult:
+        """将gather收集到的结果或异常统一为ToolResult"""
+        
+        if isinstance(result, ToolResult):
+            return result
+        
+        if not isinstance(result, Exception):
+            # CancelledError等非普通异常继续向上传播
+            raise result
+        
+        logger.error(f"工具 {tool_call.name} 执行失败: {result}")
+        return ToolResult(
+            tool_call=tool_call,
+            success=False,
+            error=str(result)
+        )
     
     async def _analyze_completion(self, tool_results: List[ToolResult], agent_env: AgentEnvironment) -> CompletionAnalysis:
         """分析执行结果，判断是否完成"""
@@ -464,21 +837,22 @@ class AgentRunner:
         # 暂时使用简单的启发式判断
         
         # 检查是否有明确的完成信号
-        completion_signals = ["完成", "finished", "done", "任务结束"]
         is_completed = False
         completion_reason = ""
         
-        # 检查工具执行结果中是否有完成信号
+        # 检查工具执行结果中是否有完成信号，同一遍历中统计成功数
+        success_count = 0
         for result in tool_results:
-            if result.success and result.output:
-                output_str = str(result.output).lower()
-                for signal in completion_signals:
-                    if signal in output_str:
-                        is_completed = True
-                        completion_reason = f"检测到完成信号: {signal}"
-                        break
-                if is_completed:
-                    break
+            if not result.success:
+                continue
+            success_count += 1
+            output = result.output
+            if is_completed or not output:
+                continue
+            match = _COMPLETION_RE.search(output if isinstance(output, str) else str(output))
+            if match:
+                is_completed = True
+                completion_reason = f"检测到完成信号: {match.group(0)}"
         
         # 如果没有明确信号，检查是否达到质量要求
         if not is_completed and agent_env.quality_score > 0.8:
@@ -501,7 +875,7 @@ class AgentRunner:
             ]
         
         # 计算质量指标
-        tool_success_rate = sum(1 for r in tool_results if r.success) / len(tool_results) if tool_results else 0
+        tool_success_rate = success_count / len(tool_results) if tool_results else 0
         execution_efficiency = len(tool_results) > 0
         
         # 获取工具执行统计信息
@@ -516,7 +890,7 @@ class AgentRunner:
                 "tool_success_rate": tool_success_rate,
                 "execution_efficiency": execution_efficiency,
                 "context_quality": agent_env.quality_score,
-                "total_tools_used": len(execution_stats["tools_used"]),
+                "total_tools_used": self._count_tools_used(),
                 "overall_success_rate": execution_stats["success_rate"],
                 "average_execution_time": execution_stats["average_execution_time"]
             }
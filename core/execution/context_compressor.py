@@ -4,12 +4,44 @@ Context Compressor
 8段式上下文压缩器 - 实现Claude Code的智能记忆管理
 """
 
-from typing import Dict, List, Optional, Any
+import hashlib
+import io
+import re
+from bisect import bisect_right
+from typing import Callable, ClassVar, Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 import structlog
 
 logger = structlog.get_logger(__name__)
 
+# 代码块围栏
+_FENCE_RE = re.compile(r"```")
+
+# 去除首尾空白后长度超过10的行
+_KEY_PHRASE_RE = re.compile(r"^[^\S\n]*(\S[^\n]{9,}\S)[^\S\n]*$", re.MULTILINE)
+
+# 去除首尾空白后以列表标记开头的行
+_KEY_POINT_RE = re.compile(r"^[^\S\n]*((?:[-*•]|[123]\.)[^\n]*?)[^\S\n]*$", re.MULTILINE)
+
+
+def _leading_lines(content: str, ratio: float) -> str:
+    """保留前ratio比例的行
+    
+    等价于 '\\n'.join(content.split('\\n')[:int(行数 * ratio)])，但只定位截断位置并切片一次，
+    不为每一行分配字符串。
+    """
+    keep = int((content.count('\n') + 1) * ratio)
+    if keep <= 0:
+        return ""
+    
+    cut = -1
+    for _ in range(keep):
+        cut = content.find('\n', cut + 1)
+        if cut == -1:
+            return content
+    
+    return content[:cut]
+
 @dataclass
 class CompressionSection:
     """压缩段落"""
@@ -31,11 +63,35 @@ class CompressionResult:
 class ContextCompressor:
     """8段式上下文压缩器"""
     
-    def __init__(self):
+    # 各段落的基础重要性分数
+    _BASE_SCORES: ClassVar[Dict[str, float]] = {
+        "Primary Request and Intent": 0.9,
+        "Key Technical Concepts": 0.8,
+        "Files and Code Sections": 0.7,
+        "Errors and fixes": 0.6,
+        "Problem Solving": 0.7,
+        "All user messages": 0.5,
+        "Pending Tasks": 0.8,
+        "Current Work": 0.9
+    }
+    
+    # 内容长度分段边界及对应的长度系数：<100, <500, <1000, 其余
+    _LENGTH_BOUNDS: ClassVar[Tuple[int, ...]] = (100, 500, 1000)
+    _LENGTH_FACTORS: ClassVar[Tuple[float, ...]] = (0.8, 1.0, 0.9, 0.7)
+    
+    # 基于段落类型的重要性调整：(系数, 下限, 上限)
+    _IMPORTANCE_ADJUSTMENTS: ClassVar[Dict[str, Tuple[float, float, float]]] = {
+        "Primary Request and Intent": (1.2, 0.0, 1.0),  # 主要请求和意图最重要
+        "Current Work": (1.1, 0.0, 1.0),                # 当前工作状态很重要
+        "Errors and fixes": (0.8, 0.3, 1.0),            # 错误信息相对次要
+        "All user messages": (0.7, 0.3, 1.0)            # 用户消息相对次要
+    }
+    
+    def __init__(self) -> None:
         """初始化8段式上下文压缩器"""
         
         # 8段式压缩结构定义
-        self.compression_sections = [
+        self.compression_sections: List[str] = [
             "Primary Request and Intent",
             "Key Technical Concepts", 
             "Files and Code Sections",
@@ -47,7 +103,7 @@ class ContextCompressor:
         ]
         
         # 压缩策略配置
-        self.compression_strategies = {
+        self.compression_strategies: Dict[str, Dict[str, Any]] = {
             "Primary Request and Intent": {
                 "preserve_ratio": 0.9,
                 "strategy": "preserve_key_requirements"
@@ -81,6 +137,23 @@ class ContextCompressor:
                 "strategy": "highlight_progress"
             }
         }
+        
+        # 压缩策略名称 -> 处理函数（纯字符串处理，同步执行）
+        self._strategy_handlers: Dict[str, Callable[[str, float], str]] = {
+            "preserve_key_requirements": self._preserve_key_requirements,
+            "summarize_technical_details": self._summarize_technical_details,
+            "extract_code_snippets": self._extract_code_snippets,
+            "preserve_critical_errors": self._preserve_critical_errors,
+            "summarize_solutions": self._summarize_solutions,
+            "extract_key_messages": self._extract_key_messages,
+            "list_actionable_items": self._list_actionable_items,
+            "highlight_progress": self._highlight_progress,
+            "general_summarization": self._general_summarization
+        }
+        
+        # 压缩结果缓存：(策略, 内容摘要, 压缩比例) -> 压缩结果；跨迭代内容未变的段落直接复用
+        self._compression_cache: Dict[Tuple[str, bytes, float], str] = {}
+        self._compression_cache_size: int = 256
     
     async def compress_context(self, context: Dict[str, Any], target_ratio: float = 0.6) -> CompressionResult:
         """压缩上下文内容"""
@@ -132,186 +205,132 @@ class ContextCompressor:
         """计算初始重要性分数"""
         
         # 基于段落类型和内容长度计算重要性
-        base_scores = {
-            "Primary Request and Intent": 0.9,
-            "Key Technical Concepts": 0.8,
-            "Files and Code Sections": 0.7,
-            "Errors and fixes": 0.6,
-            "Problem Solving": 0.7,
-            "All user messages": 0.5,
-            "Pending Tasks": 0.8,
-            "Current Work": 0.9
-        }
-        
-        base_score = base_scores.get(section_name, 0.5)
-        
-        # 基于内容长度调整分数
-        content_length = len(content)
-        if content_length < 100:
-            length_factor = 0.8
-        elif content_length < 500:
-            length_factor = 1.0
-        elif content_length < 1000:
-            length_factor = 0.9
-        else:
-            length_factor = 0.7
+        base_score = self._BASE_SCORES.get(section_name, 0.5)
+        length_factor = self._LENGTH_FACTORS[bisect_right(self._LENGTH_BOUNDS, len(content))]
         
         return base_score * length_factor
     
     async def _calculate_importance_scores(self, sections: List[CompressionSection]) -> List[CompressionSection]:
         """计算重要性分数"""
         
+        adjustments = self._IMPORTANCE_ADJUSTMENTS
+        
         for section in sections:
-            # 基于内容特征调整重要性
-            if section.name == "Primary Request and Intent":
-                # 主要请求和意图最重要
-                section.importance_score = min(1.0, section.importance_score * 1.2)
-            
-            elif section.name == "Current Work":
-                # 当前工作状态很重要
-                section.importance_score = min(1.0, section.importance_score * 1.1)
-            
-            elif section.name == "Errors and fixes":
-                # 错误信息相对次要
-                section.importance_score = max(0.3, section.importance_score * 0.8)
-            
-            elif section.name == "All user messages":
-                # 用户消息相对次要
-                section.importance_score = max(0.3, section.importance_score * 0.7)
+            # 基于段落类型调整重要性
+            adjustment = adjustments.get(section.name)
+            if adjustment is not None:
+                factor, lower, upper = adjustment
+                section.importance_score = min(upper, max(lower, section.importance_score * factor))
         
         return sections
     
     async def _apply_compression_strategies(self, sections: List[CompressionSection], target_ratio: float) -> List[CompressionSection]:
         """应用压缩策略"""
         
+        # 各策略处理函数都是同步的纯计算，直接逐段执行，不经过gather调度
         for section in sections:
-            strategy_name = self.compression_strategies.get(section.name, {}).get("strategy", "general_summarization")
-            
-            # 应用相应的压缩策略
-            compressed_content = await self._apply_compression_strategy(
+            section.compressed_content = self._apply_compression_strategy(
                 section.content, 
-                strategy_name, 
+                self.compression_strategies.get(section.name, {}).get("strategy", "general_summarization"), 
                 section.compression_ratio,
                 target_ratio
             )
-            
-            section.compressed_content = compressed_content
         
         return sections
     
-    async def _apply_compression_strategy(self, content: str, strategy: str, preserve_ratio: float, target_ratio: float) -> str:
+    def _apply_compression_strategy(self, content: str, strategy: str, preserve_ratio: float, target_ratio: float) -> str:
         """应用具体的压缩策略"""
         
         # 调整压缩比例以适应目标比例
         adjusted_ratio = preserve_ratio * target_ratio
         
-        if strategy == "preserve_key_requirements":
-            return await self._preserve_key_requirements(content, adjusted_ratio)
-        elif strategy == "summarize_technical_details":
-            return await self._summarize_technical_details(content, adjusted_ratio)
-        elif strategy == "extract_code_snippets":
-            return await self._extract_code_snippets(content, adjusted_ratio)
-        elif strategy == "preserve_critical_errors":
-            return await self._preserve_critical_errors(content, adjusted_ratio)
-        elif strategy == "summarize_solutions":
-            return await self._summarize_solutions(content, adjusted_ratio)
-        elif strategy == "extract_key_messages":
-            return await self._extract_key_messages(content, adjusted_ratio)
-        elif strategy == "list_actionable_items":
-            return await self._list_actionable_items(content, adjusted_ratio)
-        elif strategy == "highlight_progress":
-            return await self._highlight_progress(content, adjusted_ratio)
-        else:
-            return await self._general_summarization(content, adjusted_ratio)
+        cache_key = (strategy, hashlib.blake2b(content.encode(), digest_size=16).digest(), adjusted_ratio)
+        cached = self._compression_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        handler = self._strategy_handlers.get(strategy, self._general_summarization)
+        compressed = handler(content, adjusted_ratio)
+        
+        if len(self._compression_cache) >= self._compression_cache_size:
+            # 淘汰最早缓存的结果
+            self._compression_cache.pop(next(iter(self._compression_cache)))
+        self._compression_cache[cache_key] = compressed
+        
+        return compressed
     
-    async def _preserve_key_requirements(self, content: str, ratio: float) -> str:
+    def _preserve_key_requirements(self, content: str, ratio: float) -> str:
         """保留关键需求"""
         # 提取关键词汇和短语
         key_phrases = self._extract_key_phrases(content)
         return "\n".join(key_phrases[:int(len(key_phrases) * ratio)])
     
-    async def _summarize_technical_details(self, content: str, ratio: float) -> str:
+    def _summarize_technical_details(self, content: str, ratio: float) -> str:
         """总结技术细节"""
         # 提取技术概念和定义
-        lines = content.split('\n')
-        return '\n'.join(lines[:int(len(lines) * ratio)])
+        return _leading_lines(content, ratio)
     
-    async def _extract_code_snippets(self, content: str, ratio: float) -> str:
+    def _extract_code_snippets(self, content: str, ratio: float) -> str:
         """提取代码片段"""
         # 保留重要的代码块
-        if "```" in content:
-            # 保留代码块，压缩其他内容
-            code_blocks = content.split("```")
-            preserved_content = []
-            for i, block in enumerate(code_blocks):
-                if i % 2 == 1:  # 代码块
-                    preserved_content.append(f"```{block}```")
-                else:  # 非代码块
-                    compressed = block[:int(len(block) * ratio)]
-                    if compressed:
-                        preserved_content.append(compressed)
-            return "".join(preserved_content)
-        else:
+        fence_positions = [match.start() for match in _FENCE_RE.finditer(content)]
+        if not fence_positions:
             return content[:int(len(content) * ratio)]
+        
+        # 围栏之间交替为非代码块/代码块，按下标切片，只复制保留下来的部分
+        buffer = io.StringIO()
+        segment_start = 0
+        for i, segment_end in enumerate(fence_positions + [len(content)]):
+            if i % 2 == 1:  # 代码块
+                buffer.write("```")
+                buffer.write(content[segment_start:segment_end])
+                buffer.write("```")
+            else:  # 非代码块，压缩其他内容
+                keep = int((segment_end - segment_start) * ratio)
+                buffer.write(content[segment_start:segment_start + keep])
+            segment_start = segment_end + 3
+        
+        return buffer.getvalue()
     
-    async def _preserve_critical_errors(self, content: str, ratio: float) -> str:
+    def _preserve_critical_errors(self, content: str, ratio: float) -> str:
         """保留关键错误"""
         # 保留错误信息和解决方案
-        lines = content.split('\n')
-        return '\n'.join(lines[:int(len(lines) * ratio)])
+        return _leading_lines(content, ratio)
     
-    async def _summarize_solutions(self, content: str, ratio: float) -> str:
+    def _summarize_solutions(self, content: str, ratio: float) -> str:
         """总结解决方案"""
         # 提取解决方案要点
         key_points = self._extract_key_points(content)
         return "\n".join(key_points[:int(len(key_points) * ratio)])
     
-    async def _extract_key_messages(self, content: str, ratio: float) -> str:
+    def _extract_key_messages(self, content: str, ratio: float) -> str:
         """提取关键消息"""
         # 保留重要的用户消息
-        messages = content.split('\n')
-        return '\n'.join(messages[:int(len(messages) * ratio)])
+        return _leading_lines(content, ratio)
     
-    async def _list_actionable_items(self, content: str, ratio: float) -> str:
+    def _list_actionable_items(self, content: str, ratio: float) -> str:
         """列出可执行项目"""
         # 保留待处理任务
-        tasks = content.split('\n')
-        return '\n'.join(tasks[:int(len(tasks) * ratio)])
+        return _leading_lines(content, ratio)
     
-    async def _highlight_progress(self, content: str, ratio: float) -> str:
+    def _highlight_progress(self, content: str, ratio: float) -> str:
         """突出进展"""
         # 保留当前工作状态
         return content[:int(len(content) * ratio)]
     
-    async def _general_summarization(self, content: str, ratio: float) -> str:
+    def _general_summarization(self, content: str, ratio: float) -> str:
         """通用摘要"""
         return content[:int(len(content) * ratio)]
     
     def _extract_key_phrases(self, content: str) -> List[str]:
         """提取关键短语"""
-        # 简单的关键词提取
-        lines = content.split('\n')
-        key_phrases = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and len(line) > 10:  # 过滤太短的行
-                key_phrases.append(line)
-        
-        return key_phrases
+        # 简单的关键词提取，过滤太短的行
+        return _KEY_PHRASE_RE.findall(content)
     
     def _extract_key_points(self, content: str) -> List[str]:
         """提取关键要点"""
         # 提取以特定标记开头的行
-        lines = content.split('\n')
-        key_points = []
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith(('-', '*', '•', '1.', '2.', '3.')):
-                key_points.append(line)
-        
-        return key_points
+        return _KEY_POINT_RE.findall(content)
     
     async def _generate_compression_result(self, sections: List[CompressionSection], original_context: Dict[str, Any]) -> CompressionResult:
         """生成压缩结果"""
@@ -400,7 +419,7 @@ class ContextCompressor:
         #         llm_result = await llm.ainvoke(handoff_prompt)
                 
         #         # 提取响应内容
-        #         response = self._extract_llm_response(llm_result)
+        #         response = _llm_response.extract_llm_response(llm_result)
                 
         #         return response
         #     except Exception as e:
@@ -452,30 +471,3 @@ class ContextCompressor:
         """
         
         return summary
-    
-    def _extract_llm_response(self, llm_result) -> str:
-        """从LLM结果中提取响应内容"""
-        
-        try:
-            # 尝试从不同格式的结果中提取内容
-            if hasattr(llm_result, 'generations') and llm_result.generations:
-                # LangChain标准格式
-                generation = llm_result.generations[0][0]
-                if hasattr(generation, 'text'):
-                    return generation.text
-            
-            elif hasattr(llm_result, 'content'):
-                # 直接包含content属性
-                return llm_result.content
-            
-            elif hasattr(llm_result, 'text'):
-                # 直接包含text属性
-                return llm_result.text
-            
-            else:
-                # 降级处理
-                return str(llm_result)
-                
-        except Exception as e:
-            logger.error(f"提取LLM响应失败: {e}")
-            return str(llm_result)
@@ -4,8 +4,12 @@ Execution Controller
 执行控制器 - 控制Agent执行的各种条件
 """
 
-from typing import Dict, List, Optional, Any
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Any
 from dataclasses import dataclass
+import re
+import sys
 import structlog
 import logging
 
@@ -20,7 +24,57 @@ from models.base import (
 
 logger = structlog.get_logger(__name__)
 
-@dataclass
+# 控制决策历史保留上限
+_CONTROL_HISTORY_LIMIT = 1000
+
+# 结构化估算上下文大小时的最大递归深度，更深的对象按固定开销计
+_SIZE_ESTIMATE_DEPTH = 3
+_NESTED_OBJECT_OVERHEAD = 32
+
+# 停止信号编译为单个忽略大小写的交替正则，响应文本只扫描一遍
+_STOP_SIGNAL_PATTERN = re.compile("|".join(map(re.escape, (
+    "task completed", "任务完成", "已完成", "完成",
+    "work finished", "工作完成", "执行完毕", "任务结束",
+    "mission accomplished", "目标达成", "需求满足"
+))), re.IGNORECASE)
+
+# 控制决策使用的固定词汇，统一驻留后所有ControlDecision共享同一字符串对象
+_REASON_TERMINATE_HINT = sys.intern("工具结果提示结束执行")
+_REASON_MAX_ITERATIONS = sys.intern("达到最大执行轮数限制")
+_REASON_QUALITY_REACHED = sys.intern("达到质量阈值")
+_REASON_CONTEXT_TOO_LARGE = sys.intern("上下文过大")
+_REASON_STOP_SIGNAL = sys.intern("检测到停止信号")
+_REASON_INEFFICIENT = sys.intern("执行效率低下")
+_REASON_RESOURCE_EXHAUSTED = sys.intern("资源使用过高")
+_REASON_NORMAL = sys.intern("执行条件正常")
+
+_ACTION_STOP = sys.intern("停止执行")
+_ACTION_COMPRESS = sys.intern("压缩上下文")
+_ACTION_OPTIMIZE = sys.intern("优化执行策略")
+_ACTION_CONTINUE = sys.intern("继续执行")
+
+_PRIORITY_HIGH = sys.intern("high")
+_PRIORITY_MEDIUM = sys.intern("medium")
+_PRIORITY_LOW = sys.intern("low")
+
+def _estimate_size(value: Any, depth: int = _SIZE_ESTIMATE_DEPTH) -> int:
+    """估算对象序列化后的长度，只累加字符串等标量的长度，不生成完整的字符串表示"""
+    
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if value is None or isinstance(value, (bool, int, float)):
+        return 8
+    if depth <= 0:
+        return _NESTED_OBJECT_OVERHEAD
+    if isinstance(value, dict):
+        return sum(_estimate_size(k, depth - 1) + _estimate_size(v, depth - 1) + 4 for k, v in value.items()) + 2
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(_estimate_size(item, depth - 1) + 2 for item in value) + 2
+    if hasattr(value, '__dict__'):
+        return _estimate_size(vars(value), depth - 1) + len(type(value).__name__)
+    return _NESTED_OBJECT_OVERHEAD
+
+@dataclass(slots=True)
 class ExecutionMetrics:
     """执行指标"""
     iteration_count: int
@@ -30,7 +84,7 @@ class ExecutionMetrics:
     quality_score: float
     context_size: int
 
-@dataclass
+@dataclass(slots=True)
 class ControlDecision:
     """控制决策"""
     can_continue: bool
@@ -44,58 +98,88 @@ class ExecutionController:
     def __init__(self, config: ExecutionConfig):
         self.config = config
         self.iteration_metrics: Dict[int, ExecutionMetrics] = {}
-        self.control_history: List[ControlDecision] = []
+        
+        # 健康度聚合用的累计和，随update_metrics增量更新
+        self._quality_sum = 0.0
+        self._success_rate_sum = 0.0
+        self.control_history: Deque[ControlDecision] = deque(maxlen=_CONTROL_HISTORY_LIMIT)
+        
+        # 决策统计随记录增量更新，不受历史上限影响
+        self._continue_count = 0
+        self._stop_count = 0
+        self._priority_stats: Dict[str, Dict[str, int]] = {}
     
     def can_continue(self, iteration: int, agent_env: AgentEnvironment) -> bool:
         """检查是否可以继续执行"""
         
+        # 0. 工具结果明确提示结束时直接停止，跳过其余检查
+        if getattr(agent_env, 'terminate_hint', False):
+            logger.info("工具结果提示结束执行")
+            self._record_control_decision(iteration, False, _REASON_TERMINATE_HINT, _ACTION_STOP, _PRIORITY_HIGH)
+            return False
+        
         # 1. 检查最大轮数限制
         if iteration >= self.config.max_iterations:
-            logger.info(f"达到最大执行轮数限制: {self.config.max_iterations}")
-            self._record_control_decision(iteration, False, "达到最大执行轮数限制", "停止执行", "high")
+            logger.info("达到最大执行轮数限制", max_iterations=self.config.max_iterations)
+            self._record_control_decision(iteration, False, _REASON_MAX_ITERATIONS, _ACTION_STOP, _PRIORITY_HIGH)
             return False
         
         # 2. 检查质量阈值
         if hasattr(agent_env, 'quality_score') and agent_env.quality_score >= self.config.quality_threshold:
-            logger.info(f"达到质量阈值: {agent_env.quality_score}")
-            self._record_control_decision(iteration, False, "达到质量阈值", "停止执行", "medium")
+            logger.info("达到质量阈值", quality_score=agent_env.quality_score)
+            self._record_control_decision(iteration, False, _REASON_QUALITY_REACHED, _ACTION_STOP, _PRIORITY_MEDIUM)
             return False
         
+        # 上下文大小在本次检查中只计算一次，供后续各项检查共用
+        context_size = self._get_context_size(agent_env)
+        
         # 3. 检查上下文大小
-        if self._is_context_too_large(agent_env):
+        if self._is_context_too_large(context_size):
             logger.info("上下文过大，需要压缩")
-            self._record_control_decision(iteration, True, "上下文过大", "压缩上下文", "medium")
+            self._record_control_decision(iteration, True, _REASON_CONTEXT_TOO_LARGE, _ACTION_COMPRESS, _PRIORITY_MEDIUM)
             return True
         
         # 4. 检查是否有明确的停止信号
         if self._has_stop_signal(agent_env):
             logger.info("检测到停止信号")
-            self._record_control_decision(iteration, False, "检测到停止信号", "停止执行", "high")
+            self._record_control_decision(iteration, False, _REASON_STOP_SIGNAL, _ACTION_STOP, _PRIORITY_HIGH)
             return False
         
         # 5. 检查执行效率
         if self._is_execution_inefficient(iteration, agent_env):
             logger.info("执行效率低下，建议优化")
-            self._record_control_decision(iteration, True, "执行效率低下", "优化执行策略", "medium")
+            self._record_control_decision(iteration, True, _REASON_INEFFICIENT, _ACTION_OPTIMIZE, _PRIORITY_MEDIUM)
             return True
         
         # 6. 检查资源使用
-        if self._is_resource_exhausted(agent_env):
+        if self._is_resource_exhausted(agent_env, context_size):
             logger.info("资源使用过高，需要调整")
-            self._record_control_decision(iteration, False, "资源使用过高", "停止执行", "high")
+            self._record_control_decision(iteration, False, _REASON_RESOURCE_EXHAUSTED, _ACTION_STOP, _PRIORITY_HIGH)
             return False
         
         # 可以继续执行
-        self._record_control_decision(iteration, True, "执行条件正常", "继续执行", "low")
+        self._record_control_decision(iteration, True, _REASON_NORMAL, _ACTION_CONTINUE, _PRIORITY_LOW)
         return True
     
-    def _is_context_too_large(self, agent_env: AgentEnvironment) -> bool:
-        """检查上下文是否过大"""
+    def _get_context_size(self, agent_env: AgentEnvironment) -> Optional[int]:
+        """获取上下文大小，没有上下文时返回None"""
         
         if not hasattr(agent_env, 'context'):
+            return None
+        
+        # AgentEnvironment缓存了上下文长度，上下文未变化时为O(1)
+        if isinstance(agent_env, AgentEnvironment):
+            return agent_env.context_len
+        
+        # 其他环境对象按结构估算，避免生成完整的字符串表示
+        return _estimate_size(agent_env.context)
+    
+    def _is_context_too_large(self, context_size: Optional[int]) -> bool:
+        """检查上下文是否过大"""
+        
+        if context_size is None:
             return False
         
-        context_size = len(str(agent_env.context))
         max_size = 10000  # 可配置的最大上下文大小
         
         return context_size > max_size
@@ -105,14 +189,7 @@ class ExecutionController:
         
         # 检查LLM响应中是否包含完成信号
         if hasattr(agent_env, 'last_response') and agent_env.last_response:
-            response = agent_env.last_response.lower()
-            stop_signals = [
-                "task completed", "任务完成", "已完成", "完成",
-                "work finished", "工作完成", "执行完毕", "任务结束",
-                "mission accomplished", "目标达成", "需求满足"
-            ]
-            
-            return any(signal in response for signal in stop_signals)
+            return _STOP_SIGNAL_PATTERN.search(agent_env.last_response) is not None
         
         return False
     
@@ -136,14 +213,12 @@ class ExecutionController:
         
         return False
     
-    def _is_resource_exhausted(self, agent_env: AgentEnvironment) -> bool:
+    def _is_resource_exhausted(self, agent_env: AgentEnvironment, context_size: Optional[int]) -> bool:
         """检查资源是否耗尽"""
         
         # 检查内存使用（模拟）
-        if hasattr(agent_env, 'context'):
-            context_size = len(str(agent_env.context))
-            if context_size > 50000:  # 50KB限制
-                return True
+        if context_size is not None and context_size > 50000:  # 50KB限制
+            return True
         
         # 检查执行时间
         if hasattr(agent_env, 'total_execution_time'):
@@ -164,9 +239,21 @@ class ExecutionController:
         
         self.control_history.append(decision)
         
-        # 记录到日志
+        # 增量更新决策统计
+        outcome = "continue" if can_continue else "stop"
+        if can_continue:
+            self._continue_count += 1
+        else:
+            self._stop_count += 1
+        self._priority_stats.setdefault(priority, {"continue": 0, "stop": 0})[outcome] += 1
+        
+        # 记录到日志，字段以关键字参数传递，级别被过滤时不做格式化
         log_level = logging.INFO if can_continue else logging.WARNING
-        logger.log(log_level, f"执行控制决策 [轮次{iteration}]: {reason} -> {action}")
+        logger.log(log_level, "执行控制决策", iteration=iteration, reason=reason, action=action)
+    
+    def _recent_decisions(self, count: int) -> List[ControlDecision]:
+        """最近count个控制决策（按时间顺序）"""
+        return list(islice(reversed(self.control_history), count))[::-1]
     
     def get_control_summary(self) -> Dict[str, Any]:
         """获取控制摘要"""
@@ -174,27 +261,13 @@ class ExecutionController:
         if not self.control_history:
             return {"message": "暂无控制决策记录"}
         
-        # 统计决策类型
-        continue_count = sum(1 for d in self.control_history if d.can_continue)
-        stop_count = len(self.control_history) - continue_count
-        
-        # 按优先级统计
-        priority_stats = {}
-        for decision in self.control_history:
-            priority = decision.priority
-            if priority not in priority_stats:
-                priority_stats[priority] = {"continue": 0, "stop": 0}
-            
-            if decision.can_continue:
-                priority_stats[priority]["continue"] += 1
-            else:
-                priority_stats[priority]["stop"] += 1
-        
         return {
-            "total_decisions": len(self.control_history),
-            "continue_decisions": continue_count,
-            "stop_decisions": stop_count,
-            "priority_statistics": priority_stats,
+            "total_decisions": self._continue_count + self._stop_count,
+            "continue_decisions": self._continue_count,
+            "stop_decisions": self._stop_count,
+            "priority_statistics": {
+                priority: counts.copy() for priority, counts in self._priority_stats.items()
+            },
             "recent_decisions": [
                 {
                     "iteration": i,
@@ -203,12 +276,15 @@ class ExecutionController:
                     "action": d.suggested_action,
                     "priority": d.priority
                 }
-                for i, d in enumerate(self.control_history[-5:])  # 最近5个决策
+                for i, d in enumerate(self._recent_decisions(5))  # 最近5个决策
             ]
         }
     
-    def suggest_optimization(self, iteration: int, agent_env: AgentEnvironment) -> List[str]:
-        """建议优化措施"""
+    def suggest_optimization(self, iteration: int, agent_env: AgentEnvironment, ctx_size: Optional[int] = None) -> List[str]:
+        """建议优化措施
+        
+        调用方已计算过上下文大小时可通过ctx_size传入，避免重复计算。
+        """
         
         suggestions = []
         
@@ -218,8 +294,8 @@ class ExecutionController:
                 suggestions.append("质量分数较低，建议重新评估任务理解")
                 suggestions.append("考虑使用更多相关工具来提升输出质量")
         
-        if hasattr(agent_env, 'context'):
-            context_size = len(str(agent_env.context))
+        context_size = ctx_size if ctx_size is not None else self._get_context_size(agent_env)
+        if context_size is not None:
             if context_size > 8000:
                 suggestions.append("上下文过大，建议进行压缩")
                 suggestions.append("考虑移除不相关的历史信息")
@@ -229,7 +305,7 @@ class ExecutionController:
             suggestions.append("考虑简化任务分解，减少迭代次数")
         
         # 基于控制历史提供建议
-        recent_stops = [d for d in self.control_history[-3:] if not d.can_continue]
+        recent_stops = [d for d in self._recent_decisions(3) if not d.can_continue]
         if recent_stops:
             for decision in recent_stops:
                 if "效率" in decision.reason:
@@ -242,7 +318,15 @@ class ExecutionController:
     def update_metrics(self, iteration: int, metrics: ExecutionMetrics):
         """更新执行指标"""
         
+        # 同一轮次重复更新时先扣除旧值
+        replaced = self.iteration_metrics.get(iteration)
+        if replaced is not None:
+            self._quality_sum -= replaced.quality_score
+            self._success_rate_sum -= replaced.success_rate
+        
         self.iteration_metrics[iteration] = metrics
+        self._quality_sum += metrics.quality_score
+        self._success_rate_sum += metrics.success_rate
         
         # 基于指标调整控制策略
         if iteration > 1:
@@ -251,12 +335,12 @@ class ExecutionController:
                 # 检查质量提升
                 quality_improvement = metrics.quality_score - prev_metrics.quality_score
                 if quality_improvement < 0.1 and iteration > 3:
-                    logger.warning(f"轮次 {iteration} 质量提升不明显: {quality_improvement:.3f}")
+                    logger.warning("质量提升不明显", iteration=iteration, quality_improvement=round(quality_improvement, 3))
                 
                 # 检查执行效率
                 time_per_tool = metrics.total_execution_time / max(metrics.tool_execution_count, 1)
                 if time_per_tool > 10.0:  # 每个工具超过10秒
-                    logger.warning(f"轮次 {iteration} 工具执行时间过长: {time_per_tool:.2f}s")
+                    logger.warning("工具执行时间过长", iteration=iteration, time_per_tool=round(time_per_tool, 2))
     
     def get_execution_health(self) -> Dict[str, Any]:
         """获取执行健康状态"""
@@ -266,8 +350,8 @@ class ExecutionController:
         
         # 计算健康分数
         total_iterations = len(self.iteration_metrics)
-        avg_quality = sum(m.quality_score for m in self.iteration_metrics.values()) / total_iterations
-        avg_success_rate = sum(m.success_rate for m in self.iteration_metrics.values()) / total_iterations
+        avg_quality = self._quality_sum / total_iterations
+        avg_success_rate = self._success_rate_sum / total_iterations
         
         # 判断健康状态
         if avg_quality > 0.8 and avg_success_rate > 0.9:
@@ -283,5 +367,5 @@ class ExecutionController:
             "average_quality": avg_quality,
             "average_success_rate": avg_success_rate,
             "latest_metrics": self.iteration_metrics.get(max(self.iteration_metrics.keys())),
-            "control_decisions": len(self.control_history)
+            "control_decisions": self._continue_count + self._stop_count
         }
@@ -5,18 +5,26 @@ Tool Executor
 """
 
 import asyncio
-from typing import Dict, List, Optional, Any, Union
+import time
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Any, Set, Tuple, Union
 from datetime import datetime
 import structlog
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from tools.mcp import MCPToolRegistry
 from models.base import ToolExecutionResult
 
 logger = structlog.get_logger(__name__)
 
+# 可重试的瞬时错误及重试退避的基础间隔（秒）
+# 超时不重试：wait_for取消不会撤销已产生的副作用，非幂等工具（写文件、git、shell）重试可能执行两次
+_RETRYABLE_ERRORS = (ConnectionError,)
+_RETRY_BASE_DELAY = 0.1
 
-@dataclass
+
+@dataclass(slots=True, eq=False)
 class ToolCall:
     """工具调用定义"""
     tool_name: str
@@ -28,7 +36,7 @@ class ToolCall:
     max_retries: int = 3  # 最大重试次数
 
 
-@dataclass
+@dataclass(slots=True)
 class ToolResult:
     """工具执行结果"""
     tool_name: str
@@ -39,13 +47,14 @@ class ToolResult:
     metadata: Dict[str, Any] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ExecutionStrategy:
     """执行策略"""
     strategy_type: str  # "parallel", "sequential", "mixed"
     parallel_tools: List[str]  # 可以并行执行的工具
     sequential_tools: List[str]  # 必须串行执行的工具
     execution_order: List[str]  # 执行顺序
+    levels: List[List[int]] = field(default_factory=list)  # 按依赖拓扑分层的调用下标，同层可并行
 
 
 class ToolExecutor:
@@ -58,20 +67,33 @@ class ToolExecutor:
     - 资源密集型工具避免同时执行
     """
     
-    def __init__(self, tool_registry: MCPToolRegistry):
+    def __init__(self, tool_registry: MCPToolRegistry, max_parallel: int = 8):
         """初始化工具执行器"""
         self.tool_registry = tool_registry  # 依赖注入的工具注册表
         
+        # 并行执行的并发上限，避免大批量调用同时压到MCP服务
+        self.max_parallel = max_parallel
+        self._parallel_semaphore = asyncio.Semaphore(max_parallel)
+        
         # 执行历史管理
-        self.execution_history: List[ToolExecutionResult] = []
+        self.execution_history: Deque[ToolExecutionResult] = deque(maxlen=1000)
         self.execution_stats: Dict[str, Dict[str, Any]] = {}
         
+        # 所有工具的汇总计数，随每次调用增量更新
+        self._aggregate_stats: Dict[str, int] = {"total_calls": 0, "successful_calls": 0, "failed_calls": 0}
+        
+        # 工具最近调用时间（epoch秒），读取统计时只格式化上次读取后被调用过的工具
+        self._last_called: Dict[str, float] = {}
+        self._last_called_dirty: Set[str] = set()
+        
         logger.info("工具执行器初始化完成")
     
     async def execute_single_tool(self, 
                                 tool_name: str, 
                                 parameters: Dict[str, Any], 
-                                context: Dict[str, Any] = None) -> ToolResult:
+                                context: Dict[str, Any] = None,
+                                timeout: Optional[float] = None,
+                                max_retries: int = 0) -> ToolResult:
         """
         执行单个工具
         
@@ -79,17 +101,33 @@ class ToolExecutor:
             tool_name: 工具名称
             parameters: 工具参数
             context: 执行上下文
+            timeout: 单次尝试的超时时间（秒），为None时不限制
+            max_retries: 连接错误时的最大重试次数，按指数退避等待；超时不重试
             
         Returns:
             工具执行结果
         """
-        start_time = datetime.now()
+        start_time = time.perf_counter()
+        attempts = 0
+        deadline = None
         
         try:
-            # 根据工具类型选择执行器并执行工具
-            result = await self._execute_tool_by_type(tool_name, parameters, context)
+            while True:
+                attempts += 1
+                # 根据工具类型选择执行器并执行工具，超时后返回失败结果而不是拖住整批调用
+                deadline = asyncio.timeout(timeout)
+                try:
+                    async with deadline:
+                        result = await self._execute_tool_by_type(tool_name, parameters, context)
+                    break
+                except _RETRYABLE_ERRORS as e:
+                    if attempts > max_retries:
+                        raise
+                    delay = _RETRY_BASE_DELAY * 2 ** (attempts - 1)
+                    logger.warning("工具执行失败，准备重试", tool_name=tool_name, attempt=attempts, error_type=type(e).__name__, delay=delay)
+                    await asyncio.sleep(delay)
             
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             
             # 构建结果
             tool_result = ToolResult(
@@ -98,17 +136,33 @@ class ToolExecutor:
                 result=result.output if hasattr(result, 'output') else result.result,
                 error=result.error,
                 execution_time=execution_time,
-                metadata=result.metadata
+                metadata={**(result.metadata or {}), "attempts": attempts}
             )
             
             # 记录执行历史
-            self._record_execution_history(tool_name, True, execution_time, context)
+            self._record_execution_history(tool_name, result.success, execution_time, context, result.error)
             
             return tool_result
             
         except Exception as e:
-            execution_time = (datetime.now() - start_time).total_seconds()
-            logger.error(f"执行工具 {tool_name} 失败: {e}")
+            execution_time = time.perf_counter() - start_time
+            
+            # 只有本次尝试的超时上下文到期才算超时，工具自身抛出的TimeoutError按普通失败处理
+            if isinstance(e, TimeoutError) and deadline is not None and deadline.expired():
+                error_message = f"工具执行超时（{timeout}秒）"
+                logger.error("工具执行超时", tool_name=tool_name, timeout=timeout)
+                
+                self._record_execution_history(tool_name, False, execution_time, context, error_message)
+                
+                return ToolResult(
+                    tool_name=tool_name,
+                    success=False,
+                    error=error_message,
+                    execution_time=execution_time,
+                    metadata={"error_type": "TimeoutError", "timeout": timeout, "attempts": attempts}
+                )
+            
+            logger.error("工具执行失败", tool_name=tool_name, error=str(e))
             
             # 构建错误结果
             error_result = ToolResult(
@@ -118,7 +172,8 @@ class ToolExecutor:
                 execution_time=execution_time,
                 metadata={
                     "error_type": type(e).__name__,
-                    "error_details": str(e)
+                    "error_details": str(e),
+                    "attempts": attempts
                 }
             )
             
@@ -199,16 +254,53 @@ class ToolExecutor:
             strategy_type=strategy_type,
             parallel_tools=parallel_tools,
             sequential_tools=sequential_tools,
-            execution_order=[tc.tool_name for tc in tool_calls]
+            execution_order=[tc.tool_name for tc in tool_calls],
+            levels=self._build_dependency_levels(tool_calls) if strategy_type == "mixed" else []
         )
     
+    def _build_dependency_levels(self, tool_calls: List[ToolCall]) -> List[List[int]]:
+        """按依赖关系构建DAG，使用Kahn算法分层
+        
+        依赖按工具名称匹配本批次中的调用，不在本批次中的依赖视为已满足。
+        存在循环依赖时，剩余调用按出现顺序逐个成层串行执行。
+        """
+        indices_by_name: Dict[str, List[int]] = {}
+        for index, tool_call in enumerate(tool_calls):
+            indices_by_name.setdefault(tool_call.tool_name, []).append(index)
+        
+        dependents: List[List[int]] = [[] for _ in tool_calls]
+        in_degree = [0] * len(tool_calls)
+        for index, tool_call in enumerate(tool_calls):
+            for dependency in set(tool_call.dependencies or ()):
+                for upstream in indices_by_name.get(dependency, ()):
+                    if upstream != index:
+                        dependents[upstream].append(index)
+                        in_degree[index] += 1
+        
+        levels = []
+        current = [index for index, degree in enumerate(in_degree) if degree == 0]
+        while current:
+            levels.append(current)
+            next_level = []
+            for index in current:
+                for dependent in dependents[index]:
+                    in_degree[dependent] -= 1
+                    if in_degree[dependent] == 0:
+                        next_level.append(dependent)
+            current = sorted(next_level)
+        
+        remaining = [index for index, degree in enumerate(in_degree) if degree > 0]
+        if remaining:
+            logger.warning("检测到工具循环依赖，按顺序串行执行", tools=[tool_calls[i].tool_name for i in remaining])
+            levels.extend([index] for index in remaining)
+        
+        return levels
+    
     async def _execute_parallel(self, tool_calls: List[ToolCall], context: Dict[str, Any]) -> List[ToolResult]:
-        """并行执行工具"""
+        """并行执行工具（并发数受max_parallel限制）"""
         tasks = []
         for tool_call in tool_calls:
-            task = asyncio.create_task(
-                self.execute_single_tool(tool_call.tool_name, tool_call.parameters, context)
-            )
+            task = asyncio.create_task(self._execute_bounded(tool_call, context))
             tasks.append(task)
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -229,29 +321,34 @@ class ToolExecutor:
         
         return processed_results
     
+    async def _execute_bounded(self, tool_call: ToolCall, context: Dict[str, Any]) -> ToolResult:
+        """在并发信号量内执行单个工具调用"""
+        async with self._parallel_semaphore:
+            return await self.execute_single_tool(
+                tool_call.tool_name, tool_call.parameters, context, tool_call.timeout, tool_call.max_retries
+            )
+    
     async def _execute_sequential(self, tool_calls: List[ToolCall], context: Dict[str, Any]) -> List[ToolResult]:
         """串行执行工具"""
         results = []
         for tool_call in tool_calls:
-            result = await self.execute_single_tool(tool_call.tool_name, tool_call.parameters, context)
+            result = await self.execute_single_tool(
+                tool_call.tool_name, tool_call.parameters, context, tool_call.timeout, tool_call.max_retries
+            )
             results.append(result)
         return results
     
     async def _execute_mixed(self, tool_calls: List[ToolCall], strategy: ExecutionStrategy, context: Dict[str, Any]) -> List[ToolResult]:
-        """混合执行工具"""
-        results = []
+        """混合执行工具
         
-        # 先执行串行工具
-        for tool_name in strategy.sequential_tools:
-            tool_call = next(tc for tc in tool_calls if tc.tool_name == tool_name)
-            result = await self.execute_single_tool(tool_call.tool_name, tool_call.parameters, context)
-            results.append(result)
+        按依赖拓扑逐层执行，同层工具并行；按下标回填结果，结果顺序与调用顺序一致。
+        """
+        results: List[Optional[ToolResult]] = [None] * len(tool_calls)
         
-        # 再执行并行工具
-        parallel_calls = [tc for tc in tool_calls if tc.tool_name in strategy.parallel_tools]
-        if parallel_calls:
-            parallel_results = await self._execute_parallel(parallel_calls, context)
-            results.extend(parallel_results)
+        for level in strategy.levels:
+            level_results = await self._execute_parallel([tool_calls[index] for index in level], context)
+            for index, result in zip(level, level_results):
+                results[index] = result
         
         return results
     
@@ -280,8 +377,11 @@ class ToolExecutor:
                 return result
             else:
                 # 包装为 ToolExecutionResult 格式
+                server_name, role = self._resolve_record_source(tool_name, context)
                 return ToolExecutionResult(
                     tool_name=tool_name,
+                    server_name=server_name,
+                    role=role,
                     success=True,
                     result=result,
                     execution_time=0,  # 这里会在上层重新计算
@@ -289,7 +389,7 @@ class ToolExecutor:
                 )
             
         except Exception as e:
-            logger.error(f"执行工具 {tool_name} 失败: {e}")
+            logger.error("工具执行失败", tool_name=tool_name, error=str(e))
             raise
     
     def _record_execution_history(self, 
@@ -299,10 +399,16 @@ class ToolExecutor:
                                 context: Dict[str, Any] = None, 
                                 error: str = None):
         """记录执行历史"""
+        # 统计不依赖历史记录的构建，先行更新
+        self._update_execution_stats(tool_name, success, execution_time)
+        
         try:
             # 创建执行结果记录
+            server_name, role = self._resolve_record_source(tool_name, context)
             execution_result = ToolExecutionResult(
                 tool_name=tool_name,
+                server_name=server_name,
+                role=role,
                 success=success,
                 execution_time=execution_time,
                 error=error,
@@ -312,19 +418,21 @@ class ToolExecutor:
                 }
             )
             
-            # 添加到历史记录
+            # 添加到历史记录，超出上限时自动淘汰最早的记录
             self.execution_history.append(execution_result)
             
-            # 限制历史记录大小
-            if len(self.execution_history) > 1000:
-                self.execution_history = self.execution_history[-1000:]
-            
-            # 更新统计信息
-            self._update_execution_stats(tool_name, success, execution_time)
-            
         except Exception as e:
             logger.error(f"记录执行历史失败: {e}")
     
+    def _resolve_record_source(self, tool_name: str, context: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        """解析执行记录所需的服务器名称与调用角色，无法确定时记为unknown"""
+        tool = getattr(self.tool_registry, 'registered_tools', {}).get(tool_name)
+        server_name = getattr(tool, 'server_name', None) or "unknown"
+        
+        context = context or {}
+        role = context.get("role") or getattr(context.get("agent_env"), 'role', None) or "unknown"
+        return server_name, role
+    
     def _update_execution_stats(self, tool_name: str, success: bool, execution_time: float):
         """更新执行统计"""
         if tool_name not in self.execution_stats:
@@ -341,40 +449,53 @@ class ToolExecutor:
         stats["total_calls"] += 1
         stats["total_execution_time"] += execution_time
         stats["average_execution_time"] = stats["total_execution_time"] / stats["total_calls"]
-        stats["last_called"] = datetime.now().isoformat()
+        self._last_called[tool_name] = time.time()
+        self._last_called_dirty.add(tool_name)
         
-        if success:
-            stats["successful_calls"] += 1
-        else:
-            stats["failed_calls"] += 1
+        outcome = "successful_calls" if success else "failed_calls"
+        stats[outcome] += 1
+        
+        aggregate = self._aggregate_stats
+        aggregate["total_calls"] += 1
+        aggregate[outcome] += 1
     
     def get_execution_history(self, tool_name: str = None, limit: int = 100) -> List[ToolExecutionResult]:
         """获取执行历史"""
+        # 从最新记录向前取limit条，再恢复为时间顺序
+        records = reversed(self.execution_history)
         if tool_name:
-            filtered_history = [
-                record for record in self.execution_history 
-                if record.tool_name == tool_name
-            ]
-            return filtered_history[-limit:]
-        else:
-            return self.execution_history[-limit:]
+            records = (record for record in records if record.tool_name == tool_name)
+        return list(islice(records, limit))[::-1]
     
     def get_execution_stats(self, tool_name: str = None) -> Dict[str, Any]:
         """获取执行统计"""
         if tool_name:
+            if tool_name in self._last_called_dirty:
+                self._last_called_dirty.discard(tool_name)
+                self._format_last_called(tool_name)
             return self.execution_stats.get(tool_name, {})
         else:
+            for name in self._last_called_dirty:
+                self._format_last_called(name)
+            self._last_called_dirty.clear()
             return {
                 "total_tools": len(self.execution_stats),
-                "total_calls": sum(stats["total_calls"] for stats in self.execution_stats.values()),
-                "successful_calls": sum(stats["successful_calls"] for stats in self.execution_stats.values()),
-                "failed_calls": sum(stats["failed_calls"] for stats in self.execution_stats.values()),
+                **self._aggregate_stats,
                 "tools_stats": self.execution_stats
             }
     
+    def _format_last_called(self, tool_name: str):
+        """把记录的最近调用时间格式化写入统计"""
+        last_called = self._last_called.get(tool_name)
+        if last_called is not None and tool_name in self.execution_stats:
+            self.execution_stats[tool_name]["last_called"] = datetime.fromtimestamp(last_called).isoformat()
+    
     def clear_execution_history(self):
         """清空执行历史"""
         self.execution_history.clear()
         self.execution_stats.clear()
+        self._last_called.clear()
+        self._last_called_dirty.clear()
+        self._aggregate_stats = {"total_calls": 0, "successful_calls": 0, "failed_calls": 0}
         logger.info("执行历史已清空")
 
@@ -5,14 +5,14 @@ Tool Manager
 """
 
 import asyncio
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Tuple, Union
 from datetime import datetime
 import structlog
 
 # 导入MCP组件
 from tools.mcp import MCPToolRegistry
-from models.base import MCPToolDefinition, ToolExecutionResult
-from .executor import ToolExecutor
+from models.base import MCPToolDefinition
+from .executor import ToolExecutor, ToolResult
 
 logger = structlog.get_logger(__name__)
 
@@ -36,6 +36,10 @@ class ToolManager:
         # 工具执行器
         self.tool_executor: ToolExecutor = ToolExecutor(self.tool_registry)
         
+        # 分类/服务器列表快照，按注册表版本号失效: (版本号, 快照)
+        self._categories_cache: Optional[Tuple[int, Tuple[str, ...]]] = None
+        self._servers_cache: Optional[Tuple[int, Tuple[str, ...]]] = None
+        
         logger.info("工具管理器初始化完成")
     
     
@@ -83,13 +87,19 @@ class ToolManager:
         """搜索工具"""
         return await self.tool_registry.search_tools(query)
     
-    def get_categories(self) -> List[str]:
-        """获取所有分类"""
-        return self.tool_registry.get_categories()
+    def get_categories(self) -> Tuple[str, ...]:
+        """获取所有分类（注册表未变化时返回缓存的不可变快照）"""
+        version = self.tool_registry.version
+        if self._categories_cache is None or self._categories_cache[0] != version:
+            self._categories_cache = (version, tuple(self.tool_registry.get_categories()))
+        return self._categories_cache[1]
     
-    def get_servers(self) -> List[str]:
-        """获取所有服务器"""
-        return self.tool_registry.get_servers()
+    def get_servers(self) -> Tuple[str, ...]:
+        """获取所有服务器（注册表未变化时返回缓存的不可变快照）"""
+        version = self.tool_registry.version
+        if self._servers_cache is None or self._servers_cache[0] != version:
+            self._servers_cache = (version, tuple(self.tool_registry.get_servers()))
+        return self._servers_cache[1]
     
     def get_tool_stats(self) -> Dict[str, Any]:
         """获取工具统计信息"""
@@ -98,60 +108,33 @@ class ToolManager:
     async def execute_tool(self, 
                           tool_name: str, 
                           parameters: Dict[str, Any], 
-                          context: Dict[str, Any] = None) -> ToolExecutionResult:
-        """执行单个工具"""
-        try:
-            if not self.tool_executor:
-                raise RuntimeError("工具执行器未初始化")
-            
-            # 通过工具执行器执行工具
-            result = await self.tool_executor.execute_single_tool(tool_name, parameters, context)
-            
-            # 转换结果格式以保持兼容性
-            tool_result = ToolExecutionResult(
-                success=result.success,
-                result=result.result,
-                error=result.error,
-                execution_time=result.execution_time,
-                metadata=result.metadata
-            )
-            
-            return tool_result
-            
-        except Exception as e:
-            raise
+                          context: Dict[str, Any] = None) -> ToolResult:
+        """执行单个工具
+        
+        直接返回执行器的结果对象，其 success/result/error/execution_time/metadata
+        字段与调用方使用的接口一致，无需再复制一份。
+        """
+        if not self.tool_executor:
+            raise RuntimeError("工具执行器未初始化")
+        
+        # 通过工具执行器执行工具
+        return await self.tool_executor.execute_single_tool(tool_name, parameters, context)
     
     async def execute_tools_batch(self, 
                                 tool_calls: List[Dict[str, Any]], 
-                                context: Dict[str, Any] = None) -> List[ToolExecutionResult]:
+                                context: Dict[str, Any] = None) -> List[ToolResult]:
         """批量执行工具"""
         try:
             if not self.tool_executor:
                 raise RuntimeError("工具执行器未初始化")
             
-            # 使用工具执行器
-            results = await self.tool_executor.execute_tool_calls(tool_calls, context)
-            
-            # 转换结果格式以保持兼容性
-            tool_results = []
-            for result in results:
-                tool_result = ToolExecutionResult(
-                    success=result.success,
-                    result=result.result,
-                    error=result.error,
-                    execution_time=result.execution_time,
-                    metadata=result.metadata
-                )
-                tool_results.append(tool_result)
-            
-            return tool_results
+            # 使用工具执行器，结果按调用顺序返回
+            return await self.tool_executor.execute_tool_calls(tool_calls, context)
             
         except Exception as e:
             logger.error(f"批量执行工具失败: {e}")
             raise
     
-
-    
     async def cleanup(self):
         """清理资源"""
         try:
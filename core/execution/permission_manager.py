@@ -4,12 +4,65 @@ Permission Manager
 权限管理器 - 负责工具访问权限控制
 """
 
-from typing import Dict, List, Optional, Any
+import asyncio
+import re
+from collections import OrderedDict
+from enum import IntEnum
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional, Any, Set, Tuple, Union
+from urllib.parse import urlsplit
 import structlog
 
 logger = structlog.get_logger(__name__)
 
 
+class SecurityLevel(IntEnum):
+    """工具安全级别，数值越大越敏感，可直接比较大小"""
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+    CRITICAL = 3
+    
+    @property
+    def label(self) -> str:
+        """对外展示的小写名称"""
+        return self.name.lower()
+
+
+# 静态权限决策缓存的最大条目数
+_DECISION_CACHE_SIZE = 1024
+
+# 可直接使用关键工具的管理员角色
+_ADMIN_ROLES = frozenset({"系统管理员", "超级用户"})
+
+# 危险命令片段编译为单个忽略大小写的交替正则，命令只需扫描一遍
+_DANGEROUS_COMMANDS = (
+    "rm -rf", "format", "dd", "mkfs", "fdisk",
+    "shutdown", "reboot", "halt", "poweroff",
+    "chmod 777", "chown root", "su -", "sudo"
+)
+_DANGEROUS_COMMAND_PATTERN = re.compile("|".join(map(re.escape, _DANGEROUS_COMMANDS)), re.IGNORECASE)
+
+# 不安全的路径前缀：系统敏感目录、用户主目录以及所有绝对路径，一次startswith完成检查
+_UNSAFE_PATH_PREFIXES = ("/etc", "/sys", "/proc", "/dev", "/boot", "/root", "/home", "~", "/")
+
+# URL只允许的协议和禁止访问的本地主机
+_ALLOWED_URL_SCHEMES = frozenset({"http", "https"})
+_BLOCKED_URL_HOSTS = frozenset({"localhost", "127.0.0.1", "0.0.0.0", "::1"})
+
+
+@lru_cache(maxsize=1024)
+def _split_url(url: str) -> Optional[Tuple[str, str]]:
+    """解析URL的协议和主机名（已小写），无法解析时返回None；同一URL重试时不重复解析"""
+    try:
+        parts = urlsplit(url)
+        # 去掉FQDN末尾的"."，避免"localhost."绕过本地主机检查
+        return parts.scheme, (parts.hostname or "").rstrip(".")
+    except ValueError:
+        return None
+
+
 class PermissionManager:
     """
     权限管理器
@@ -20,17 +73,54 @@ class PermissionManager:
     - 动态权限验证
     """
     
+    __slots__ = (
+        "role_permissions", "_role_index", "_role_global",
+        "tool_security_levels", "dynamic_rules", "_sync_rules", "_async_rules",
+        "_decision_cache", "cache_hits", "cache_misses", "_param_validators",
+        "_tool_security_labels", "_tool_security_view"
+    )
+    
     def __init__(self):
         """初始化权限管理器"""
-        # 角色权限配置
-        self.role_permissions = self._load_default_role_permissions()
+        # 角色权限配置，权限列表保存为元组，可直接作为只读结果返回
+        self.role_permissions: Dict[str, Tuple[str, ...]] = {
+            role: tuple(permissions) for role, permissions in self._load_default_role_permissions().items()
+        }
+        
+        # 角色权限索引：角色 -> 类别 -> 工具名集合（"*"表示类别通配），以及拥有全局权限的角色
+        self._role_index: Dict[str, Dict[str, FrozenSet[str]]] = {}
+        self._role_global: Set[str] = set()
+        for role in self.role_permissions:
+            self._rebuild_role_index(role)
         
         # 工具安全级别配置
         self.tool_security_levels = self._load_default_tool_security_levels()
         
+        # 安全级别的对外名称及其只读视图，随更新同步维护，读取时无需复制
+        self._tool_security_labels: Dict[str, str] = {
+            tool_key: level.label for tool_key, level in self.tool_security_levels.items()
+        }
+        self._tool_security_view = MappingProxyType(self._tool_security_labels)
+        
         # 动态权限规则
         self.dynamic_rules: List[callable] = []
         
+        # 动态规则按是否为协程函数分类，同步规则无需进入事件循环
+        self._sync_rules: List[callable] = []
+        self._async_rules: List[callable] = []
+        
+        # (角色, 类别, 工具名) -> (静态权限结果, 安全级别)，按LRU淘汰；动态规则和参数检查不缓存
+        self._decision_cache: "OrderedDict[Tuple[str, str, str], Tuple[bool, SecurityLevel]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # 敏感参数检查表：(参数名, 检查函数, 错误描述, 错误码)，按顺序检查
+        self._param_validators = (
+            ("file_path", self._is_safe_file_path, "不安全的文件路径", "UNSAFE_FILE_PATH"),
+            ("url", self._is_safe_url, "不安全的URL", "UNSAFE_URL"),
+            ("command", self._is_safe_command, "不安全的命令", "UNSAFE_COMMAND")
+        )
+        
         logger.info("权限管理器初始化完成")
     
     def _load_default_role_permissions(self) -> Dict[str, List[str]]:
@@ -73,19 +163,65 @@ class PermissionManager:
             ]
         }
     
-    def _load_default_tool_security_levels(self) -> Dict[str, str]:
+    def _rebuild_role_index(self, role: str):
+        """根据角色的权限列表重建该角色的权限索引"""
+        categories: Dict[str, Set[str]] = {}
+        self._role_global.discard(role)
+        
+        for permission in self.role_permissions.get(role, []):
+            if permission == "*:*":
+                self._role_global.add(role)
+                continue
+            category, _, name = permission.partition(":")
+            categories.setdefault(category, set()).add(name)
+        
+        self._role_index[role] = {category: frozenset(names) for category, names in categories.items()}
+    
+    def _load_default_tool_security_levels(self) -> Dict[str, SecurityLevel]:
         """加载默认工具安全级别配置"""
         return {
-            "file_operations:write": "high",
-            "file_operations:delete": "critical",
-            "system_utilities:execute": "high",
-            "system_utilities:shutdown": "critical",
-            "web_services:api_call": "medium",
-            "user_interaction:ask": "low",
-            "development_tools:test": "medium",
-            "development_tools:deploy": "high"
+            "file_operations:write": SecurityLevel.HIGH,
+            "file_operations:delete": SecurityLevel.CRITICAL,
+            "system_utilities:execute": SecurityLevel.HIGH,
+            "system_utilities:shutdown": SecurityLevel.CRITICAL,
+            "web_services:api_call": SecurityLevel.MEDIUM,
+            "user_interaction:ask": SecurityLevel.LOW,
+            "development_tools:test": SecurityLevel.MEDIUM,
+            "development_tools:deploy": SecurityLevel.HIGH
         }
     
+    def _check_static(self, role: str, tool_category: str, tool_name: str) -> bool:
+        """基于预建索引检查静态权限，全局、类别通配符和具体工具在一次类别查找中完成"""
+        if role in self._role_global:
+            return True
+        
+        category_map = self._role_index.get(role)
+        if not category_map:
+            return False
+        
+        names = category_map.get(tool_category)
+        return names is not None and (tool_name in names or "*" in names)
+    
+    def check_permission_sync(self, 
+                              role: str, 
+                              tool_category: str, 
+                              tool_name: str) -> bool:
+        """
+        同步检查权限（静态权限和同步动态规则，不包含异步规则）
+        
+        Args:
+            role: 角色名称
+            tool_category: 工具类别
+            tool_name: 工具名称
+            
+        Returns:
+            是否有权限
+        """
+        if self._check_static(role, tool_category, tool_name):
+            return True
+        
+        return bool(self._sync_rules) and self._check_sync_rules(role, tool_category, tool_name)
+    
     async def check_permission(self, 
                              role: str, 
                              tool_category: str, 
@@ -101,34 +237,15 @@ class PermissionManager:
         Returns:
             是否有权限
         """
-        try:
-            # 获取角色权限
-            role_perms = self.role_permissions.get(role, [])
-            
-            # 检查具体工具权限
-            specific_perm = f"{tool_category}:{tool_name}"
-            if specific_perm in role_perms:
-                return True
-            
-            # 检查类别通配符权限
-            category_perm = f"{tool_category}:*"
-            if category_perm in role_perms:
-                return True
-            
-            # 检查全局权限
-            if "*:*" in role_perms:
-                return True
-            
-            # 检查动态权限规则
-            if await self._check_dynamic_rules(role, tool_category, tool_name):
-                return True
-            
-            logger.debug(f"角色 {role} 没有权限使用工具 {tool_category}:{tool_name}")
-            return False
-            
-        except Exception as e:
-            logger.error(f"检查权限失败: {e}")
-            return False
+        if self.check_permission_sync(role, tool_category, tool_name):
+            return True
+        
+        # 只有注册了异步规则时才需要等待
+        if self._async_rules and await self._check_dynamic_rules(role, tool_category, tool_name):
+            return True
+        
+        logger.debug(f"角色 {role} 没有权限使用工具 {tool_category}:{tool_name}")
+        return False
     
     async def validate_tool_access(self, 
                                  role: str,
@@ -145,51 +262,72 @@ class PermissionManager:
         Returns:
             验证结果
         """
-        try:
-            # 基础权限检查
-            tool_category = getattr(tool_info, 'category', 'unknown')
-            tool_name = getattr(tool_info, 'name', 'unknown')
-            
-            has_permission = await self.check_permission(role, tool_category, tool_name)
-            
-            if not has_permission:
-                return {
-                    "is_valid": False,
-                    "error_message": f"角色 {role} 没有权限使用工具 {tool_name}",
-                    "error_code": "PERMISSION_DENIED"
-                }
-            
-            # 安全级别检查
-            security_level = self._get_tool_security_level(tool_category, tool_name)
-            
-            if security_level == "critical":
-                # 关键工具需要额外验证
-                additional_validation = await self._validate_critical_tool_usage(
-                    role, tool_info, parameters
-                )
-                if not additional_validation["is_valid"]:
-                    return additional_validation
-            
-            # 参数安全检查
-            param_validation = await self._validate_tool_parameters(tool_info, parameters)
-            if not param_validation["is_valid"]:
-                return param_validation
-            
-            return {
-                "is_valid": True,
-                "security_level": security_level,
-                "permissions_granted": [f"{tool_category}:{tool_name}"]
-            }
-            
-        except Exception as e:
-            logger.error(f"验证工具访问权限失败: {e}")
+        # 基础权限检查
+        tool_category = getattr(tool_info, 'category', 'unknown')
+        tool_name = getattr(tool_info, 'name', 'unknown')
+        
+        has_permission, security_level = self._get_static_decision(role, tool_category, tool_name)
+        if not has_permission and self._sync_rules:
+            has_permission = self._check_sync_rules(role, tool_category, tool_name)
+        if not has_permission and self._async_rules:
+            has_permission = await self._check_dynamic_rules(role, tool_category, tool_name)
+        
+        if not has_permission:
             return {
                 "is_valid": False,
-                "error_message": f"权限验证失败: {str(e)}",
-                "error_code": "VALIDATION_ERROR"
+                "error_message": f"角色 {role} 没有权限使用工具 {tool_name}",
+                "error_code": "PERMISSION_DENIED"
             }
+        
+        # 安全级别检查
+        if security_level >= SecurityLevel.CRITICAL:
+            # 关键工具需要额外验证
+            additional_validation = await self._validate_critical_tool_usage(
+                role, tool_info, parameters
+            )
+            if not additional_validation["is_valid"]:
+                return additional_validation
+        
+        # 参数安全检查
+        param_validation = await self._validate_tool_parameters(tool_info, parameters)
+        if not param_validation["is_valid"]:
+            return param_validation
+        
+        return {
+            "is_valid": True,
+            "security_level": security_level.label,
+            "permissions_granted": [f"{tool_category}:{tool_name}"]
+        }
     
-    def _get_tool_security_level(self, tool_category: str, tool_name: str) -> str:
+    def _get_static_decision(self, role: str, tool_category: str, tool_name: str) -> Tuple[bool, SecurityLevel]:
+        """获取静态权限结果和安全级别，命中缓存时只需一次字典查找"""
+        key = (role, tool_category, tool_name)
+        decision = self._decision_cache.get(key)
+        if decision is not None:
+            self._decision_cache.move_to_end(key)
+            self.cache_hits += 1
+            return decision
+        
+        self.cache_misses += 1
+        decision = (
+            self._check_static(role, tool_category, tool_name),
+            self._get_tool_security_level(tool_category, tool_name)
+        )
+        self._decision_cache[key] = decision
+        if len(self._decision_cache) > _DECISION_CACHE_SIZE:
+            self._decision_cache.popitem(last=False)
+        return decision
+    
+    def _invalidate_decisions(self, role: Optional[str] = None, tool_category: Optional[str] = None):
+        """按角色或工具类别使缓存的权限决策失效"""
+        stale_keys = [
+            key for key in self._decision_cache
+            if (role is not None and key[0] == role) or (tool_category is not None and key[1] == tool_category)
+        ]
+        for key in stale_keys:
+            del self._decision_cache[key]
+    
+    def _get_tool_security_level(self, tool_category: str, tool_name: str) -> SecurityLevel:
         """获取工具安全级别"""
         # 检查具体工具的安全级别
         specific_key = f"{tool_category}:{tool_name}"
@@ -202,7 +340,7 @@ class PermissionManager:
             return self.tool_security_levels[category_key]
         
         # 默认安全级别
-        return "medium"
+        return SecurityLevel.MEDIUM
     
     async def _validate_critical_tool_usage(self, 
                                           role: str,
@@ -214,7 +352,7 @@ class PermissionManager:
             # 例如：需要管理员确认、审计日志等
             
             # 检查角色是否有管理员权限
-            if role in ["系统管理员", "超级用户"]:
+            if role in _ADMIN_ROLES:
                 return {"is_valid": True}
             
             # 检查是否有特殊授权
@@ -240,34 +378,13 @@ class PermissionManager:
                                       parameters: Dict[str, Any]) -> Dict[str, Any]:
         """验证工具参数安全性"""
         try:
-            # 检查文件路径安全性
-            if "file_path" in parameters:
-                file_path = parameters["file_path"]
-                if not self._is_safe_file_path(file_path):
-                    return {
-                        "is_valid": False,
-                        "error_message": f"不安全的文件路径: {file_path}",
-                        "error_code": "UNSAFE_FILE_PATH"
-                    }
-            
-            # 检查URL安全性
-            if "url" in parameters:
-                url = parameters["url"]
-                if not self._is_safe_url(url):
+            # 只对参数中实际出现的敏感字段调用对应的检查函数
+            for key, validator, label, error_code in self._param_validators:
+                if key in parameters and not validator(parameters[key]):
                     return {
                         "is_valid": False,
-                        "error_message": f"不安全的URL: {url}",
-                        "error_code": "UNSAFE_URL"
-                    }
-            
-            # 检查命令执行安全性
-            if "command" in parameters:
-                command = parameters["command"]
-                if not self._is_safe_command(command):
-                    return {
-                        "is_valid": False,
-                        "error_message": f"不安全的命令: {command}",
-                        "error_code": "UNSAFE_COMMAND"
+                        "error_message": f"{label}: {parameters[key]}",
+                        "error_code": error_code
                     }
             
             return {"is_valid": True}
@@ -282,41 +399,21 @@ class PermissionManager:
     
     def _is_safe_file_path(self, file_path: str) -> bool:
         """检查文件路径安全性"""
-        if not file_path:
-            return False
-        
-        # 禁止路径遍历
-        if ".." in file_path or file_path.startswith("/"):
-            return False
-        
-        # 禁止访问系统敏感目录
-        sensitive_dirs = ["/etc", "/sys", "/proc", "/dev", "/boot", "/root"]
-        for sensitive_dir in sensitive_dirs:
-            if file_path.startswith(sensitive_dir):
-                return False
-        
-        # 禁止访问用户主目录之外的文件
-        if file_path.startswith("~") or file_path.startswith("/home"):
-            return False
-        
-        return True
+        # 禁止空路径、路径遍历、绝对路径、敏感目录和用户主目录
+        return bool(file_path) and ".." not in file_path and not file_path.startswith(_UNSAFE_PATH_PREFIXES)
     
     def _is_safe_url(self, url: str) -> bool:
         """检查URL安全性"""
         if not url:
             return False
         
-        # 只允许HTTP和HTTPS
-        if not url.startswith(("http://", "https://")):
+        parsed = _split_url(url)
+        if parsed is None:
             return False
         
-        # 禁止访问本地地址
-        local_addresses = ["localhost", "127.0.0.1", "0.0.0.0", "::1"]
-        for local_addr in local_addresses:
-            if local_addr in url:
-                return False
-        
-        return True
+        # 只允许HTTP和HTTPS，必须有主机名，禁止访问本地地址
+        scheme, hostname = parsed
+        return scheme in _ALLOWED_URL_SCHEMES and bool(hostname) and hostname not in _BLOCKED_URL_HOSTS
     
     def _is_safe_command(self, command: str) -> bool:
         """检查命令安全性"""
@@ -324,17 +421,7 @@ class PermissionManager:
             return False
         
         # 禁止危险命令
-        dangerous_commands = [
-            "rm -rf", "format", "dd", "mkfs", "fdisk",
-            "shutdown", "reboot", "halt", "poweroff",
-            "chmod 777", "chown root", "su -", "sudo"
-        ]
-        
-        for dangerous_cmd in dangerous_commands:
-            if dangerous_cmd in command.lower():
-                return False
-        
-        return True
+        return _DANGEROUS_COMMAND_PATTERN.search(command) is None
     
     async def _check_special_authorization(self, role: str, tool_info: Any) -> bool:
         """检查特殊授权"""
@@ -342,10 +429,22 @@ class PermissionManager:
         # 例如：临时授权、紧急情况授权等
         return False
     
+    def _check_sync_rules(self, role: str, tool_category: str, tool_name: str) -> bool:
+        """检查同步动态权限规则"""
+        try:
+            for rule in self._sync_rules:
+                if rule(role, tool_category, tool_name):
+                    return True
+            return False
+            
+        except Exception as e:
+            logger.error(f"检查动态权限规则失败: {e}")
+            return False
+    
     async def _check_dynamic_rules(self, role: str, tool_category: str, tool_name: str) -> bool:
-        """检查动态权限规则"""
+        """检查异步动态权限规则"""
         try:
-            for rule in self.dynamic_rules:
+            for rule in self._async_rules:
                 if await rule(role, tool_category, tool_name):
                     return True
             return False
@@ -357,32 +456,44 @@ class PermissionManager:
     def add_dynamic_rule(self, rule: callable):
         """添加动态权限规则"""
         self.dynamic_rules.append(rule)
+        if asyncio.iscoroutinefunction(rule):
+            self._async_rules.append(rule)
+        else:
+            self._sync_rules.append(rule)
         logger.info("动态权限规则已添加")
     
     def remove_dynamic_rule(self, rule: callable):
         """移除动态权限规则"""
         if rule in self.dynamic_rules:
             self.dynamic_rules.remove(rule)
+            rules = self._async_rules if rule in self._async_rules else self._sync_rules
+            rules.remove(rule)
             logger.info("动态权限规则已移除")
     
     def update_role_permissions(self, role: str, permissions: List[str]):
         """更新角色权限"""
-        self.role_permissions[role] = permissions
+        self.role_permissions[role] = tuple(permissions)
+        self._rebuild_role_index(role)
+        self._invalidate_decisions(role=role)
         logger.info(f"角色 {role} 权限已更新")
     
-    def update_tool_security_level(self, tool_key: str, security_level: str):
-        """更新工具安全级别"""
+    def update_tool_security_level(self, tool_key: str, security_level: Union[str, SecurityLevel]):
+        """更新工具安全级别（支持 "low"/"medium"/"high"/"critical" 字符串）"""
+        if not isinstance(security_level, SecurityLevel):
+            security_level = SecurityLevel[security_level.upper()]
         self.tool_security_levels[tool_key] = security_level
-        logger.info(f"工具 {tool_key} 安全级别已更新为 {security_level}")
+        self._tool_security_labels[tool_key] = security_level.label
+        self._invalidate_decisions(tool_category=tool_key.split(":", 1)[0])
+        logger.info(f"工具 {tool_key} 安全级别已更新为 {security_level.label}")
     
-    def get_role_permissions(self, role: str) -> List[str]:
-        """获取角色权限"""
-        return self.role_permissions.get(role, [])
+    def get_role_permissions(self, role: str) -> Tuple[str, ...]:
+        """获取角色权限（只读元组）"""
+        return self.role_permissions.get(role, ())
     
     def get_all_roles(self) -> List[str]:
         """获取所有角色"""
         return list(self.role_permissions.keys())
     
-    def get_tool_security_info(self) -> Dict[str, str]:
-        """获取工具安全级别信息"""
-        return self.tool_security_levels.copy()
+    def get_tool_security_info(self) -> Mapping[str, str]:
+        """获取工具安全级别信息（只读视图，随更新实时反映）"""
+        return self._tool_security_view
@@ -4,13 +4,53 @@ Rate Limiter
 速率限制器 - 负责工具调用的频率控制
 """
 
-from typing import Dict, List, Optional, Any
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Any, Tuple
 from datetime import datetime, timedelta
-import asyncio
+import sys
+import time
 import structlog
 
 logger = structlog.get_logger(__name__)
 
+# 使用跟踪记录的最大键数，超出后按最近最少使用淘汰
+_MAX_TRACKED_KEYS = 100_000
+
+# 未跟踪键的空使用记录，调用方以身份比较区分"未跟踪"与"已跟踪但窗口内为空"
+_NO_USAGE: Tuple[float, ...] = ()
+
+
+@dataclass(slots=True, frozen=True)
+class ParsedAdjustment:
+    """预解析的动态调整规则，时间条件为epoch秒，检查时只做浮点比较"""
+    new_limits: Dict[str, Any]
+    start_time: float = float("-inf")
+    end_time: float = float("inf")
+    current_usage: float = 0
+    threshold: float = 0
+
+
+def _parse_adjustment(adjustment: Dict[str, Any]) -> ParsedAdjustment:
+    """将动态调整规则中的ISO时间字符串一次性解析为epoch秒"""
+    time_condition = adjustment.get("time_condition", {})
+    usage_condition = adjustment.get("usage_condition", {})
+    return ParsedAdjustment(
+        new_limits=adjustment.get("new_limits", {}),
+        start_time=datetime.fromisoformat(time_condition["start_time"]).timestamp()
+        if "start_time" in time_condition else float("-inf"),
+        end_time=datetime.fromisoformat(time_condition["end_time"]).timestamp()
+        if "end_time" in time_condition else float("inf"),
+        current_usage=usage_condition.get("current_usage", 0),
+        threshold=usage_condition.get("threshold", 0)
+    )
+
+
+def _evict_expired(timestamps: Deque[float], cutoff: float):
+    """从队首移除不晚于截止时间的记录；时间戳按追加顺序递增，摊还O(1)"""
+    while timestamps and timestamps[0] <= cutoff:
+        timestamps.popleft()
+
 
 class RateLimiter:
     """
@@ -27,15 +67,20 @@ class RateLimiter:
         # 默认速率限制配置
         self.rate_limits = self._load_default_rate_limits()
         
-        # 使用跟踪记录
-        self.usage_tracking: Dict[str, List[datetime]] = {}
+        # 类别 -> (requests, window, burst)，检查时一次查找即可取得全部限制参数
+        self._limits_fast: Dict[str, Tuple[int, int, int]] = {}
+        # 未配置类别使用的默认限制元组，随_limits_fast一起重建
+        self._default_limits: Tuple[int, int, int] = (0, 0, 0)
+        # (role, tool_category) -> 配额响应中不随调用变化的字段，限制配置变化时整体失效
+        self._quota_templates: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._rebuild_fast_limits()
         
-        # 动态限制调整
-        self.dynamic_adjustments: Dict[str, Dict[str, Any]] = {}
+        # 使用跟踪记录: (role, tool_category, tool_name) -> time.monotonic()秒，仅在对外输出时换算为时间字符串
+        # 过期记录在访问时惰性淘汰，键总数按LRU顺序封顶，无需后台清理任务
+        self.usage_tracking: "OrderedDict[Tuple[str, str, str], Deque[float]]" = OrderedDict()
         
-        # 清理任务
-        self.cleanup_task = None
-        self._start_cleanup_task()
+        # 动态限制调整（添加时预解析）
+        self.dynamic_adjustments: Dict[str, ParsedAdjustment] = {}
         
         logger.info("速率限制器初始化完成")
     
@@ -74,71 +119,57 @@ class RateLimiter:
             }
         }
     
-    def _start_cleanup_task(self):
-        """启动清理任务"""
-        self.cleanup_task = asyncio.create_task(self._cleanup_expired_records())
-    
-    async def _cleanup_expired_records(self):
-        """清理过期的使用记录"""
-        while True:
-            try:
-                await self._cleanup_expired_usage_records()
-                await asyncio.sleep(60)  # 每分钟清理一次
-                
-            except Exception as e:
-                logger.error(f"清理过期记录失败: {e}")
-                await asyncio.sleep(60)
+    def _rebuild_fast_limits(self):
+        """根据rate_limits重建限制参数元组，缺失的字段沿用默认配置"""
+        default_config = self.rate_limits["default"]
+        self._limits_fast = {
+            sys.intern(tool_category): (
+                limit_config.get("requests", default_config["requests"]),
+                limit_config.get("window", default_config["window"]),
+                limit_config.get("burst", default_config["burst"])
+            )
+            for tool_category, limit_config in self.rate_limits.items()
+        }
+        self._default_limits = self._limits_fast["default"]
+        self._quota_templates.clear()
     
-    async def _cleanup_expired_usage_records(self):
-        """清理过期的使用记录"""
-        try:
-            current_time = datetime.now()
-            expired_keys = []
-            
-            for tracking_key, timestamps in self.usage_tracking.items():
-                # 获取该工具的限制配置
-                tool_category = self._extract_tool_category(tracking_key)
-                limit_config = self.rate_limits.get(tool_category, self.rate_limits["default"])
-                window_seconds = limit_config["window"]
-                
-                # 计算截止时间
-                cutoff_time = current_time - timedelta(seconds=window_seconds)
-                
-                # 过滤过期记录
-                valid_timestamps = [
-                    ts for ts in timestamps if ts > cutoff_time
-                ]
-                
-                if valid_timestamps:
-                    self.usage_tracking[tracking_key] = valid_timestamps
-                else:
-                    expired_keys.append(tracking_key)
-            
-            # 清理过期的键
-            for key in expired_keys:
-                del self.usage_tracking[key]
-            
-            if expired_keys:
-                logger.debug(f"清理了 {len(expired_keys)} 个过期的使用记录")
-                
-        except Exception as e:
-            logger.error(f"清理过期使用记录失败: {e}")
+    def _snapshot(self, tracking_key: Tuple[str, str, str], time_window: float, current_time: float):
+        """
+        移除时间窗口之外的记录，返回窗口内的使用记录
+        
+        返回值的长度即窗口内调用次数，队首为最早的有效调用，队尾为最近一次调用，均为O(1)读取；
+        未跟踪的键以及窗口内已无记录的键返回_NO_USAGE，后者同时从跟踪记录中移除。
+        """
+        recent_usage = self.usage_tracking.get(tracking_key, _NO_USAGE)
+        if recent_usage:
+            _evict_expired(recent_usage, current_time - time_window)
+            if not recent_usage:
+                del self.usage_tracking[tracking_key]
+                return _NO_USAGE
+        return recent_usage
     
-    def _extract_tool_category(self, tracking_key: str) -> str:
-        """从跟踪键中提取工具类别"""
-        try:
-            # 跟踪键格式: "role:tool_category:tool_name"
-            parts = tracking_key.split(":")
-            if len(parts) >= 2:
-                return parts[1]
-            return "default"
-        except Exception:
-            return "default"
+    def _sweep_expired(self, current_time: float):
+        """按各类别的时间窗口淘汰所有键的过期记录，移除窗口内已无记录的键
+        
+        只在输出统计时调用，长期不再访问的键不会一直留到LRU上限才被淘汰。
+        """
+        limits_fast = self._limits_fast
+        default_limits = self._default_limits
+        
+        expired_keys = []
+        for tracking_key, timestamps in self.usage_tracking.items():
+            time_window = (limits_fast.get(tracking_key[1]) or default_limits)[1]
+            _evict_expired(timestamps, current_time - time_window)
+            if not timestamps:
+                expired_keys.append(tracking_key)
+        
+        for tracking_key in expired_keys:
+            del self.usage_tracking[tracking_key]
     
-    async def check_rate_limit(self, 
-                             role: str,
-                             tool_category: str,
-                             tool_name: str) -> bool:
+    def check_rate_limit(self, 
+                         role: str,
+                         tool_category: str,
+                         tool_name: str) -> bool:
         """
         检查速率限制
         
@@ -150,57 +181,45 @@ class RateLimiter:
         Returns:
             是否允许调用
         """
-        try:
-            # 生成跟踪键
-            tracking_key = f"{role}:{tool_category}:{tool_name}"
-            
-            # 获取限制配置
-            limit_config = self.rate_limits.get(tool_category, self.rate_limits["default"])
-            max_requests = limit_config["requests"]
-            time_window = limit_config["window"]
-            burst_limit = limit_config["burst"]
-            
-            # 获取当前使用记录
-            current_usage = self.usage_tracking.get(tracking_key, [])
-            current_time = datetime.now()
-            
-            # 计算时间窗口内的使用量
-            window_start = current_time - timedelta(seconds=time_window)
-            recent_usage = [
-                ts for ts in current_usage if ts > window_start
-            ]
-            
-            # 检查是否超出限制
-            if len(recent_usage) >= max_requests:
-                logger.debug(f"速率限制: {tracking_key} 已达到限制 {max_requests}/{time_window}s")
-                return False
-            
-            # 检查突发限制
-            if len(recent_usage) >= burst_limit:
-                # 检查最近的使用频率
-                if len(recent_usage) >= 2:
-                    time_diff = (recent_usage[-1] - recent_usage[-2]).total_seconds()
-                    if time_diff < 1:  # 如果两次调用间隔小于1秒
-                        logger.debug(f"突发限制: {tracking_key} 调用过于频繁")
-                        return False
-            
-            # 记录本次使用
-            if tracking_key not in self.usage_tracking:
-                self.usage_tracking[tracking_key] = []
-            
-            self.usage_tracking[tracking_key].append(current_time)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"检查速率限制失败: {e}")
-            # 出错时默认允许
-            return True
+        # 生成跟踪键
+        tracking_key = (role, tool_category, tool_name)
+        
+        # 获取限制配置
+        max_requests, time_window, burst_limit = self._limits_fast.get(tool_category) or self._default_limits
+        
+        # 获取窗口内的使用记录
+        current_time = time.monotonic()
+        recent_usage = self._snapshot(tracking_key, time_window, current_time)
+        
+        # 检查是否超出限制
+        if len(recent_usage) >= max_requests:
+            logger.debug(f"速率限制: {':'.join(tracking_key)} 已达到限制 {max_requests}/{time_window}s")
+            return False
+        
+        # 检查突发限制：达到突发阈值后，距上次调用（队尾）不足1秒则拒绝
+        if recent_usage and len(recent_usage) >= burst_limit and current_time - recent_usage[-1] < 1.0:
+            logger.debug(f"突发限制: {':'.join(tracking_key)} 调用过于频繁")
+            return False
+        
+        # 记录本次使用：已跟踪的键直接追加到取得的同一队列，不再重复查找
+        if recent_usage is _NO_USAGE:
+            # 新键的各组成部分驻留，后续哈希比较可走字符串同一性快路径
+            tracking_key = (sys.intern(role), sys.intern(tool_category), sys.intern(tool_name))
+            recent_usage = self.usage_tracking[tracking_key] = deque()
+            # 超出上限时淘汰最久未访问的键
+            if len(self.usage_tracking) > _MAX_TRACKED_KEYS:
+                self.usage_tracking.popitem(last=False)
+        else:
+            self.usage_tracking.move_to_end(tracking_key)
+        
+        recent_usage.append(current_time)
+        
+        return True
     
-    async def get_remaining_quota(self, 
-                                role: str,
-                                tool_category: str,
-                                tool_name: str) -> Dict[str, Any]:
+    def get_remaining_quota(self, 
+                            role: str,
+                            tool_category: str,
+                            tool_name: str) -> Dict[str, Any]:
         """
         获取剩余配额
         
@@ -212,53 +231,41 @@ class RateLimiter:
         Returns:
             配额信息
         """
-        try:
-            tracking_key = f"{role}:{tool_category}:{tool_name}"
-            
-            # 获取限制配置
-            limit_config = self.rate_limits.get(tool_category, self.rate_limits["default"])
-            max_requests = limit_config["requests"]
-            time_window = limit_config["window"]
-            
-            # 获取当前使用记录
-            current_usage = self.usage_tracking.get(tracking_key, [])
-            current_time = datetime.now()
-            
-            # 计算时间窗口内的使用量
-            window_start = current_time - timedelta(seconds=time_window)
-            recent_usage = [
-                ts for ts in current_usage if ts > window_start
-            ]
-            
-            # 计算剩余配额
-            remaining = max(0, max_requests - len(recent_usage))
-            
-            # 计算重置时间
-            reset_time = None
-            if recent_usage:
-                oldest_request = min(recent_usage)
-                reset_time = oldest_request + timedelta(seconds=time_window)
-            
-            return {
-                "remaining": remaining,
+        tracking_key = (role, tool_category, tool_name)
+        
+        # 获取限制配置
+        max_requests, time_window, _ = self._limits_fast.get(tool_category) or self._default_limits
+        
+        # 获取窗口内的使用记录
+        current_time = time.monotonic()
+        recent_usage = self._snapshot(tracking_key, time_window, current_time)
+        used = len(recent_usage)
+        
+        # 计算重置时间：队首即最早的有效请求，换算为当前时钟时间
+        reset_time = None
+        if recent_usage:
+            reset_time = datetime.now() + timedelta(seconds=recent_usage[0] + time_window - current_time)
+        
+        # 复制静态字段模板，只填充动态字段
+        template_key = (role, tool_category)
+        template = self._quota_templates.get(template_key)
+        if template is None:
+            template = self._quota_templates[template_key] = {
+                "remaining": None,
                 "total": max_requests,
-                "used": len(recent_usage),
-                "reset_time": reset_time.isoformat() if reset_time else None,
+                "used": None,
+                "reset_time": None,
                 "window_seconds": time_window,
                 "tool_category": tool_category,
                 "role": role
             }
-            
-        except Exception as e:
-            logger.error(f"获取剩余配额失败: {e}")
-            return {
-                "remaining": 0,
-                "total": 0,
-                "used": 0,
-                "reset_time": None,
-                "window_seconds": 0,
-                "error": str(e)
-            }
+        
+        quota = template.copy()
+        quota["remaining"] = max(0, max_requests - used)
+        quota["used"] = used
+        if reset_time:
+            quota["reset_time"] = reset_time.isoformat()
+        return quota
     
     async def get_rate_limit_info(self, tool_category: str = None) -> Dict[str, Any]:
         """获取速率限制信息"""
@@ -266,9 +273,11 @@ class RateLimiter:
             if tool_category:
                 return self.rate_limits.get(tool_category, {})
             
+            self._sweep_expired(time.monotonic())
+            
             return {
                 "rate_limits": self.rate_limits,
-                "usage_tracking_keys": list(self.usage_tracking.keys()),
+                "usage_tracking_keys": [":".join(tracking_key) for tracking_key in self.usage_tracking],
                 "total_tracked_tools": len(self.usage_tracking)
             }
             
@@ -283,9 +292,11 @@ class RateLimiter:
         try:
             if tool_category in self.rate_limits:
                 self.rate_limits[tool_category].update(new_limits)
+                self._rebuild_fast_limits()
                 logger.info(f"工具类别 {tool_category} 的速率限制已更新")
             else:
-                self.rate_limits[tool_category] = new_limits
+                self.rate_limits[sys.intern(tool_category)] = new_limits
+                self._rebuild_fast_limits()
                 logger.info(f"工具类别 {tool_category} 的速率限制已添加")
                 
         except Exception as e:
@@ -296,7 +307,7 @@ class RateLimiter:
                               adjustment: Dict[str, Any]):
         """添加动态调整规则"""
         try:
-            self.dynamic_adjustments[tool_category] = adjustment
+            self.dynamic_adjustments[tool_category] = _parse_adjustment(adjustment)
             logger.info(f"工具类别 {tool_category} 的动态调整规则已添加")
             
         except Exception as e:
@@ -312,88 +323,60 @@ class RateLimiter:
         except Exception as e:
             logger.error(f"移除动态调整规则失败: {e}")
     
-    async def apply_dynamic_adjustments(self):
+    def apply_dynamic_adjustments(self):
         """应用动态调整规则"""
         try:
-            current_time = datetime.now()
+            current_time = time.time()
             
             for tool_category, adjustment in self.dynamic_adjustments.items():
                 # 检查调整条件
                 if self._should_apply_adjustment(adjustment, current_time):
                     # 应用调整
-                    new_limits = adjustment.get("new_limits", {})
-                    self.update_rate_limit(tool_category, new_limits)
+                    self.update_rate_limit(tool_category, adjustment.new_limits)
                     
                     logger.info(f"已应用工具类别 {tool_category} 的动态调整")
                     
         except Exception as e:
             logger.error(f"应用动态调整失败: {e}")
     
-    def _should_apply_adjustment(self, adjustment: Dict[str, Any], current_time: datetime) -> bool:
-        """检查是否应该应用调整"""
-        try:
-            # 检查时间条件
-            if "time_condition" in adjustment:
-                time_condition = adjustment["time_condition"]
-                
-                # 检查是否在指定时间范围内
-                if "start_time" in time_condition:
-                    start_time = datetime.fromisoformat(time_condition["start_time"])
-                    if current_time < start_time:
-                        return False
-                
-                if "end_time" in time_condition:
-                    end_time = datetime.fromisoformat(time_condition["end_time"])
-                    if current_time > end_time:
-                        return False
-            
-            # 检查使用量条件
-            if "usage_condition" in adjustment:
-                usage_condition = adjustment["usage_condition"]
-                current_usage = usage_condition.get("current_usage", 0)
-                threshold = usage_condition.get("threshold", 0)
-                
-                if current_usage < threshold:
-                    return False
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"检查调整条件失败: {e}")
-            return False
+    def _should_apply_adjustment(self, adjustment: ParsedAdjustment, current_time: float) -> bool:
+        """检查是否应该应用调整：时间范围与使用量阈值均已预解析"""
+        return (adjustment.start_time <= current_time <= adjustment.end_time
+                and adjustment.current_usage >= adjustment.threshold)
     
     def get_usage_statistics(self) -> Dict[str, Any]:
         """获取使用统计信息"""
         try:
             stats = {}
             
+            # 截止时间与时钟换算基准在循环外计算一次
+            now_monotonic = time.monotonic()
+            now_wall = datetime.now()
+            recent_cutoff = now_monotonic - 3600.0
+            
+            self._sweep_expired(now_monotonic)
+            
             for tracking_key, timestamps in self.usage_tracking.items():
-                if not timestamps:
-                    continue
-                
                 # 解析跟踪键
-                parts = tracking_key.split(":")
-                if len(parts) >= 3:
-                    role, tool_category, tool_name = parts[0], parts[1], parts[2]
-                    
-                    if tool_category not in stats:
-                        stats[tool_category] = {}
-                    
-                    if role not in stats[tool_category]:
-                        stats[tool_category][role] = {}
-                    
-                    # 计算使用统计
-                    total_calls = len(timestamps)
-                    recent_calls = len([
-                        ts for ts in timestamps 
-                        if ts > datetime.now() - timedelta(hours=1)
-                    ])
-                    
-                    stats[tool_category][role][tool_name] = {
-                        "total_calls": total_calls,
-                        "recent_calls_1h": recent_calls,
-                        "last_called": max(timestamps).isoformat() if timestamps else None
-                    }
+                role, tool_category, tool_name = tracking_key
+                
+                if tool_category not in stats:
+                    stats[tool_category] = {}
+                
+                if role not in stats[tool_category]:
+                    stats[tool_category][role] = {}
+                
+                # 计算使用统计
+                total_calls = len(timestamps)
+                recent_calls = sum(1 for ts in timestamps if ts > recent_cutoff)
+                
+                last_called = now_wall - timedelta(seconds=now_monotonic - timestamps[-1])
+                
+                stats[tool_category][role][tool_name] = {
+                    "total_calls": total_calls,
+                    "recent_calls_1h": recent_calls,
+                    "last_called": last_called.isoformat()
+                }
             
             return stats
             
@@ -404,12 +387,7 @@ class RateLimiter:
     async def shutdown(self):
         """关闭速率限制器"""
         try:
-            if self.cleanup_task:
-                self.cleanup_task.cancel()
-                try:
-                    await self.cleanup_task
-                except asyncio.CancelledError:
-                    pass
+            self.usage_tracking.clear()
             
             logger.info("速率限制器已关闭")
             
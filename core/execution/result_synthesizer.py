@@ -4,8 +4,10 @@ Result Synthesizer
 结果合成器 - 整合多轮执行结果
 """
 
+import re
+from collections import Counter
 from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 import structlog
 
@@ -15,6 +17,16 @@ from .role_executor import IterationResult
 
 logger = structlog.get_logger(__name__)
 
+# 技术决策/问题解决关键词，预编译为忽略大小写的正则，一次扫描完成匹配
+_TECH_DECISION_PATTERN = re.compile(
+    "|".join(map(re.escape, ("决定", "选择", "采用", "使用", "implement", "choose", "adopt"))),
+    re.IGNORECASE
+)
+_PROBLEM_SOLUTION_PATTERN = re.compile(
+    "|".join(map(re.escape, ("解决", "修复", "优化", "solve", "fix", "optimize"))),
+    re.IGNORECASE
+)
+
 @dataclass
 class SynthesizedResult:
     """合成结果"""
@@ -27,6 +39,16 @@ class SynthesizedResult:
     total_iterations: int
     completion_status: bool
 
+@dataclass(slots=True)
+class _ExecutionStats:
+    """执行历史的汇总统计，一次遍历累积得到"""
+    completed: int = 0
+    tool_calls: int = 0
+    tool_success: int = 0
+    tool_distribution: Counter = field(default_factory=Counter)
+    quality_trend: List[float] = field(default_factory=list)
+    tool_trend: List[int] = field(default_factory=list)
+
 class ResultSynthesizer:
     """结果合成器 - 整合多轮执行结果"""
     
@@ -89,29 +111,20 @@ class ResultSynthesizer:
         if not execution_results:
             return {"message": "无执行结果"}
         
+        # 一次遍历累积全部统计
+        stats = self._collect_stats(execution_results)
+        
         # 统计基本信息
         total_iterations = len(execution_results)
-        completed_iterations = sum(1 for r in execution_results if r.is_completed)
+        completed_iterations = stats.completed
         failed_iterations = total_iterations - completed_iterations
         
         # 分析工具使用情况
-        tool_usage_stats = {}
-        total_tool_calls = 0
-        successful_tool_calls = 0
-        
-        for result in execution_results:
-            if result.tool_calls:
-                total_tool_calls += len(result.tool_calls)
-                successful_tool_calls += sum(1 for t in result.tool_results if hasattr(t, 'success') and t.success)
-                
-                for tool_call in result.tool_calls:
-                    tool_name = tool_call.name if hasattr(tool_call, 'name') else 'unknown'
-                    if tool_name not in tool_usage_stats:
-                        tool_usage_stats[tool_name] = 0
-                    tool_usage_stats[tool_name] += 1
+        total_tool_calls = stats.tool_calls
+        successful_tool_calls = stats.tool_success
         
         # 分析执行趋势
-        execution_trend = self._analyze_execution_trend(execution_results)
+        execution_trend = self._analyze_execution_trend(stats.quality_trend, stats.tool_trend)
         
         return {
             "total_iterations": total_iterations,
@@ -122,39 +135,49 @@ class ResultSynthesizer:
                 "total_calls": total_tool_calls,
                 "successful_calls": successful_tool_calls,
                 "success_rate": successful_tool_calls / total_tool_calls if total_tool_calls > 0 else 0,
-                "tool_distribution": tool_usage_stats
+                "tool_distribution": dict(stats.tool_distribution)
             },
             "execution_trend": execution_trend,
             "last_iteration": execution_results[-1].iteration if execution_results else 0
         }
     
-    def _analyze_execution_trend(self, execution_results: List[IterationResult]) -> Dict[str, Any]:
-        """分析执行趋势"""
+    def _collect_stats(self, execution_results: List[IterationResult]) -> _ExecutionStats:
+        """单次遍历执行结果，同时累积完成数、工具统计以及质量/工具使用趋势"""
         
-        if len(execution_results) < 2:
-            return {"message": "执行轮次不足，无法分析趋势"}
+        stats = _ExecutionStats()
         
-        # 分析质量变化趋势
-        quality_trend = []
         for result in execution_results:
+            if result.is_completed:
+                stats.completed += 1
+            
+            # 工具使用情况
+            if result.tool_calls:
+                stats.tool_calls += len(result.tool_calls)
+                stats.tool_success += sum(1 for t in result.tool_results if hasattr(t, 'success') and t.success)
+                stats.tool_distribution.update(getattr(tool_call, 'name', 'unknown') for tool_call in result.tool_calls)
+                stats.tool_trend.append(len(result.tool_calls))
+            else:
+                stats.tool_trend.append(0)
+            
+            # 质量变化
             if hasattr(result, 'completion_analysis') and result.completion_analysis:
-                quality = getattr(result.completion_analysis, 'confidence_score', 0.0)
-                quality_trend.append(quality)
+                stats.quality_trend.append(getattr(result.completion_analysis, 'confidence_score', 0.0))
         
-        # 分析工具使用趋势
-        tool_trend = []
-        for result in execution_results:
-            tool_count = len(result.tool_calls) if result.tool_calls else 0
-            tool_trend.append(tool_count)
+        return stats
+    
+    def _analyze_execution_trend(self, quality_trend: List[float], tool_trend: List[int]) -> Dict[str, Any]:
+        """分析执行趋势（tool_trend每轮一项，长度即执行轮次）"""
+        
+        if len(tool_trend) < 2:
+            return {"message": "执行轮次不足，无法分析趋势"}
         
         # 判断趋势方向
         def calculate_trend(values):
             if len(values) < 2:
                 return "stable"
             
-            # 计算变化率
-            changes = [values[i] - values[i-1] for i in range(1, len(values))]
-            avg_change = sum(changes) / len(changes)
+            # 计算变化率：相邻差值之和逐项抵消为末项减首项，无需逐项求差
+            avg_change = (values[-1] - values[0]) / (len(values) - 1)
             
             if avg_change > 0.1:
                 return "improving"
@@ -192,23 +215,22 @@ class ResultSynthesizer:
         
         for result in execution_results:
             # 提取技术决策
-            if result.llm_response:
-                response_lower = result.llm_response.lower()
+            response = result.llm_response
+            if response:
+                content = response[:200] + "..." if len(response) > 200 else response
                 
                 # 识别技术决策关键词
-                tech_keywords = ["决定", "选择", "采用", "使用", "implement", "choose", "adopt"]
-                if any(keyword in response_lower for keyword in tech_keywords):
+                if _TECH_DECISION_PATTERN.search(response):
                     key_info["technical_decisions"].append({
                         "iteration": result.iteration,
-                        "content": result.llm_response[:200] + "..." if len(result.llm_response) > 200 else result.llm_response
+                        "content": content
                     })
                 
                 # 识别问题解决方案
-                solution_keywords = ["解决", "修复", "优化", "solve", "fix", "optimize"]
-                if any(keyword in response_lower for keyword in solution_keywords):
+                if _PROBLEM_SOLUTION_PATTERN.search(response):
                     key_info["problem_solutions"].append({
                         "iteration": result.iteration,
-                        "content": result.llm_response[:200] + "..." if len(result.llm_response) > 200 else result.llm_response
+                        "content": content
                     })
             
             # 提取工具执行结果
@@ -401,7 +423,7 @@ class ResultSynthesizer:
         #         llm_result = await llm.ainvoke(handoff_prompt)
                 
         #         # 提取响应内容
-        #         response = self._extract_llm_response(llm_result)
+        #         response = _llm_response.extract_llm_response(llm_result)
                 
         #         return {
         #             "summary": response,
@@ -477,33 +499,6 @@ class ResultSynthesizer:
         
         return summary
     
-    def _extract_llm_response(self, llm_result) -> str:
-        """从LLM结果中提取响应内容"""
-        
-        try:
-            # 尝试从不同格式的结果中提取内容
-            if hasattr(llm_result, 'generations') and llm_result.generations:
-                # LangChain标准格式
-                generation = llm_result.generations[0][0]
-                if hasattr(generation, 'text'):
-                    return generation.text
-            
-            elif hasattr(llm_result, 'content'):
-                # 直接包含content属性
-                return llm_result.content
-            
-            elif hasattr(llm_result, 'text'):
-                # 直接包含text属性
-                return llm_result.text
-            
-            else:
-                # 降级处理
-                return str(llm_result)
-                
-        except Exception as e:
-            logger.error(f"提取LLM响应失败: {e}")
-            return str(llm_result)
-    
     async def _create_fallback_result(self, 
                                     execution_results: List[IterationResult],
                                     error: Exception,
@@ -37,7 +37,7 @@ class RoleExecutor:
         self.config = execution_config or ExecutionConfig()
         
         # 核心组件
-        self.agent_runner = AgentRunner()
+        self.agent_runner = AgentRunner(use_streaming=self.config.streaming_llm)
         self.execution_controller = ExecutionController(self.config)
         self.result_synthesizer = ResultSynthesizer()
         
@@ -150,12 +150,15 @@ class RoleExecutor:
                     # 这里应该更新8段式上下文
                     pass
         
+        # 本轮工具执行可能原地修改了上下文，使缓存的上下文长度失效
+        agent_env.mark_context_changed()
+        
         return agent_env
     
     def _should_compress_context(self, agent_env: AgentEnvironment) -> bool:
         """检查是否需要压缩上下文"""
-        # 简单的上下文大小检查
-        context_size = len(str(agent_env.context))
+        # 简单的上下文大小检查（长度按上下文缓存，不必每轮重新序列化）
+        context_size = agent_env.context_len
         return context_size > 5000  # 可配置的阈值
     
     async def _compress_context(self, agent_env: AgentEnvironment):
@@ -163,6 +166,7 @@ class RoleExecutor:
         logger.info(f"压缩角色 {agent_env.role} 的上下文")
         # 这里应该调用上下文压缩器
         # 暂时只是记录日志
+        agent_env.mark_context_changed()
     
     async def _generate_role_result(self, 
                                   execution_id: str,
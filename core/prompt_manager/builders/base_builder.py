@@ -5,7 +5,7 @@ Prompt构建器基类 - 定义所有构建器的通用接口
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 
 # 使用TYPE_CHECKING避免循环导入
 from typing import TYPE_CHECKING
@@ -64,6 +64,19 @@ class BasePromptBuilder(ABC):
         """
         return True
     
+    def get_cache_key(self, request: 'PromptBuildRequest') -> Optional[Hashable]:
+        """获取section缓存键
+        
+        输入相同的请求返回相同的键时，管理器会复用已构建的section内容。
+        
+        Args:
+            request: Prompt构建请求
+            
+        Returns:
+            Optional[Hashable]: 缓存键，None表示该section不缓存，默认不缓存
+        """
+        return None
+    
     def get_dependencies(self) -> list[str]:
         """获取依赖的其他section
         
@@ -14,21 +14,35 @@ if TYPE_CHECKING:
 
 logger = structlog.get_logger(__name__)
 
+# 8段式上下文标准sections
+_STANDARD_SECTIONS = (
+    "Primary Request and Intent",
+    "Key Technical Concepts", 
+    "Files and Code Sections",
+    "Errors and Fixes",
+    "Problem Solving Progress",
+    "All User Messages",
+    "Pending Tasks",
+    "Current Work Status"
+)
+
+# 单个section内容的最大长度，超出部分截断
+_MAX_SECTION_LENGTH = 500
+
+# context属性名 -> 8段式section名（按此顺序提取）
+_ATTRIBUTE_SECTIONS = {
+    'files': 'Files and Code Sections',
+    'errors': 'Errors and Fixes', 
+    'messages': 'All User Messages',
+    'tasks': 'Pending Tasks'
+}
+
 
 class ContextBuilder(BasePromptBuilder):
     """上下文构建器"""
     
     # 8段式上下文标准sections
-    STANDARD_SECTIONS = [
-        "Primary Request and Intent",
-        "Key Technical Concepts", 
-        "Files and Code Sections",
-        "Errors and Fixes",
-        "Problem Solving Progress",
-        "All User Messages",
-        "Pending Tasks",
-        "Current Work Status"
-    ]
+    STANDARD_SECTIONS = _STANDARD_SECTIONS
     
     async def build(self, request: 'PromptBuildRequest') -> str:
         """构建执行上下文section"""
@@ -43,12 +57,12 @@ class ContextBuilder(BasePromptBuilder):
                 # 降级处理：使用基本上下文信息
                 return await self._build_basic_context(context, request)
             
-            # 构建8段式上下文section
-            context_section = "## 当前执行上下文\n"
-            
-            for section_name, content in context_sections.items():
-                if content and content.strip():
-                    context_section += f"\n### {section_name}\n{content}\n"
+            # 构建8段式上下文section：生成器直接交给join，一次分配完成
+            context_section = "## 当前执行上下文\n" + "".join(
+                f"\n### {section_name}\n{content}\n"
+                for section_name, content in context_sections.items()
+                if content and content.strip()
+            )
             
             logger.debug(f"构建8段式上下文section完成，包含 {len(context_sections)} 个sections")
             return context_section.strip()
@@ -64,29 +78,30 @@ class ContextBuilder(BasePromptBuilder):
         context_sections = {}
         
         try:
-            # 尝试从isolated_context获取8段式sections
-            if hasattr(context, 'isolated_context') and context.isolated_context:
-                isolated = context.isolated_context
+            # 尝试从isolated_context获取8段式sections，访问方式在循环前确定一次
+            isolated = getattr(context, 'isolated_context', None)
+            if isolated:
+                sections = getattr(isolated, 'sections', None)
+                get_section = getattr(isolated, 'get_section', None)
                 
-                if hasattr(isolated, 'sections') and isolated.sections:
+                if sections:
                     # 直接使用已有的8段式sections
-                    for section_name, section_obj in isolated.sections.items():
-                        if section_obj and hasattr(section_obj, 'content'):
-                            content = section_obj.content
-                            if content and content.strip():
-                                # 限制内容长度，避免过长
-                                if len(content) > 500:
-                                    content = content[:500] + "..."
-                                context_sections[section_name] = content
-                
-                elif hasattr(isolated, 'get_section'):
+                    section_items = (
+                        (section_name, getattr(section_obj, 'content', None))
+                        for section_name, section_obj in sections.items() if section_obj
+                    )
+                elif get_section is not None:
                     # 使用get_section方法获取
-                    for section_name in self.STANDARD_SECTIONS:
-                        content = isolated.get_section(section_name, "")
-                        if content and content.strip():
-                            if len(content) > 500:
-                                content = content[:500] + "..."
-                            context_sections[section_name] = content
+                    section_items = ((section_name, get_section(section_name, "")) for section_name in _STANDARD_SECTIONS)
+                else:
+                    section_items = ()
+                
+                for section_name, content in section_items:
+                    if content and content.strip():
+                        # 限制内容长度，避免过长
+                        if len(content) > _MAX_SECTION_LENGTH:
+                            content = content[:_MAX_SECTION_LENGTH] + "..."
+                        context_sections[section_name] = content
             
             # 如果没有获取到8段式内容，尝试其他方式
             if not context_sections:
@@ -115,31 +130,17 @@ class ContextBuilder(BasePromptBuilder):
                 sections["Current Work Status"] = f"{current_work}\n当前角色: {context.current_role}".strip()
             
             # 尝试获取其他可能的属性
-            for attr_name in ['files', 'errors', 'messages', 'tasks']:
-                if hasattr(context, attr_name):
-                    attr_value = getattr(context, attr_name)
-                    if attr_value:
-                        section_name = self._map_attribute_to_section(attr_name)
-                        if section_name:
-                            sections[section_name] = str(attr_value)[:300] + "..." if len(str(attr_value)) > 300 else str(attr_value)
+            for attr_name, section_name in _ATTRIBUTE_SECTIONS.items():
+                attr_value = getattr(context, attr_name, None)
+                if attr_value:
+                    text = str(attr_value)
+                    sections[section_name] = text[:300] + "..." if len(text) > 300 else text
         
         except Exception as e:
             logger.warning(f"从属性提取上下文失败: {e}")
         
         return sections
     
-    def _map_attribute_to_section(self, attr_name: str) -> str:
-        """将属性名映射到8段式section名"""
-        
-        mapping = {
-            'files': 'Files and Code Sections',
-            'errors': 'Errors and Fixes', 
-            'messages': 'All User Messages',
-            'tasks': 'Pending Tasks'
-        }
-        
-        return mapping.get(attr_name, "")
-    
     async def _build_basic_context(self, context, request: 'PromptBuildRequest') -> str:
         """构建基本上下文信息（降级方案）"""
         
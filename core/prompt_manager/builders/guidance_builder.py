@@ -14,6 +14,56 @@ if TYPE_CHECKING:
 
 logger = structlog.get_logger(__name__)
 
+# 固定文本片段在模块加载时构建一次，构建时与变量部分一起join
+_DEFAULT_QUALITY_STANDARDS = (
+    "- 确保输出符合专业标准\n"
+    "- 保持代码和文档的一致性\n"
+    "- 遵循最佳实践和行业标准\n"
+    "- 及时识别和报告问题\n"
+)
+
+_FALLBACK_QUALITY_STANDARDS = (
+    "- 确保输出符合专业标准\n"
+    "- 遵循最佳实践\n"
+)
+
+_TASK_EXECUTION_GUIDANCE = """
+### 任务执行指导
+1. **分析阶段**: 理解任务需求，制定执行计划
+2. **执行阶段**: 使用合适的工具逐步完成任务
+3. **验证阶段**: 检查任务完成情况，确保质量
+4. **总结阶段**: 提供任务完成状态和关键信息"""
+
+_SYSTEM_REMINDER_HEAD = """
+### 重要提醒
+你是一个专业的"""
+
+_SYSTEM_REMINDER_TAIL = """，专注于完成当前任务。请遵循以下原则：
+
+**执行原则：**
+1. 使用可用的工具来完成任务
+2. 每轮执行后评估是否完成
+3. 如果任务完成，明确说明完成状态和交付物
+4. 如果任务未完成，说明下一步计划和所需信息
+5. 保持专业性和效率性
+
+**任务完成标识：**
+当任务完成时，请明确说明：
+- 任务完成状态（完成/部分完成/需要更多信息）
+- 主要交付物和成果
+- 下一步建议或注意事项
+"""
+
+
+def _bullet_list(items) -> str:
+    """将条目渲染为以"- "开头的列表行"""
+    return "".join([f"- {item}\n" for item in items])
+
+
+def _as_key(items):
+    """把列表字段转为可哈希的元组"""
+    return tuple(items) if isinstance(items, list) else items
+
 
 class GuidanceBuilder(BasePromptBuilder):
     """系统指导构建器"""
@@ -25,28 +75,28 @@ class GuidanceBuilder(BasePromptBuilder):
             role_config = request.role_config
             role = request.role
             
-            guidance_section = "## 系统执行指导\n"
+            parts = ["## 系统执行指导\n"]
             
             # 角色特定的执行要求
-            guidance_section += await self._build_role_specific_guidance(role_config)
+            parts.append(await self._build_role_specific_guidance(role_config))
             
             # 行为规则
             if hasattr(role_config, 'behavior_rules') and role_config.behavior_rules:
-                guidance_section += "\n### 行为规则\n"
-                for rule in role_config.behavior_rules:
-                    guidance_section += f"- {rule}\n"
+                parts.append("\n### 行为规则\n")
+                parts.append(_bullet_list(role_config.behavior_rules))
             
             # 质量标准
-            guidance_section += await self._build_quality_standards(role_config)
+            parts.append(await self._build_quality_standards(role_config))
             
             # 任务执行指导
-            guidance_section += self._get_task_execution_guidance()
+            parts.append(self._get_task_execution_guidance())
             
             # 系统提醒
-            guidance_section += "\n" + await self._build_system_reminder(role)
+            parts.append("\n")
+            parts.append(await self._build_system_reminder(role))
             
             logger.debug(f"构建系统指导section完成")
-            return guidance_section.strip()
+            return "".join(parts).strip()
             
         except Exception as e:
             logger.error(f"构建系统指导section失败: {e}")
@@ -55,7 +105,7 @@ class GuidanceBuilder(BasePromptBuilder):
     async def _build_role_specific_guidance(self, role_config) -> str:
         """构建角色特定的执行指导"""
         
-        guidance = ""
+        parts = []
         
         try:
             # 输出要求
@@ -63,83 +113,74 @@ class GuidanceBuilder(BasePromptBuilder):
                 capabilities = role_config.capabilities
                 
                 if hasattr(capabilities, 'output_types') and capabilities.output_types:
-                    guidance += "### 输出要求\n"
-                    for output_type in capabilities.output_types:
-                        guidance += f"- {output_type}\n"
+                    parts.append("### 输出要求\n")
+                    parts.append(_bullet_list(capabilities.output_types))
                 
                 if hasattr(capabilities, 'deliverable_formats') and capabilities.deliverable_formats:
-                    guidance += "\n### 交付格式\n"
-                    for format_type in capabilities.deliverable_formats:
-                        guidance += f"- {format_type}\n"
+                    parts.append("\n### 交付格式\n")
+                    parts.append(_bullet_list(capabilities.deliverable_formats))
             
             # 最大执行时间
             if hasattr(role_config, 'capabilities') and role_config.capabilities:
                 if hasattr(role_config.capabilities, 'average_execution_time') and role_config.capabilities.average_execution_time:
-                    guidance += f"\n### 执行时间要求\n- 建议执行时间: {role_config.capabilities.average_execution_time} 分钟内\n"
+                    parts.append(f"\n### 执行时间要求\n- 建议执行时间: {role_config.capabilities.average_execution_time} 分钟内\n")
         
         except Exception as e:
             logger.warning(f"构建角色特定指导失败: {e}")
         
-        return guidance
+        return "".join(parts)
     
     async def _build_quality_standards(self, role_config) -> str:
         """构建质量标准"""
         
-        quality_section = "\n### 质量标准\n"
-        
         try:
             # 角色特定的质量标准
             if hasattr(role_config, 'quality_gates') and role_config.quality_gates:
-                for gate in role_config.quality_gates:
-                    quality_section += f"- {gate}\n"
+                standards = _bullet_list(role_config.quality_gates)
             elif hasattr(role_config, 'success_criteria') and role_config.success_criteria:
-                for criteria in role_config.success_criteria:
-                    quality_section += f"- {criteria}\n"
+                standards = _bullet_list(role_config.success_criteria)
             else:
                 # 默认质量标准
-                quality_section += "- 确保输出符合专业标准\n"
-                quality_section += "- 保持代码和文档的一致性\n"
-                quality_section += "- 遵循最佳实践和行业标准\n"
-                quality_section += "- 及时识别和报告问题\n"
+                standards = _DEFAULT_QUALITY_STANDARDS
         
         except Exception as e:
             logger.warning(f"构建质量标准失败: {e}")
             # 使用默认标准
-            quality_section += "- 确保输出符合专业标准\n"
-            quality_section += "- 遵循最佳实践\n"
+            standards = _FALLBACK_QUALITY_STANDARDS
         
-        return quality_section
+        return "\n### 质量标准\n" + standards
     
     def _get_task_execution_guidance(self) -> str:
         """获取任务执行指导"""
         
-        return """
-### 任务执行指导
-1. **分析阶段**: 理解任务需求，制定执行计划
-2. **执行阶段**: 使用合适的工具逐步完成任务
-3. **验证阶段**: 检查任务完成情况，确保质量
-4. **总结阶段**: 提供任务完成状态和关键信息"""
+        return _TASK_EXECUTION_GUIDANCE
     
     async def _build_system_reminder(self, role: str) -> str:
         """构建系统提醒"""
         
-        return f"""
-### 重要提醒
-你是一个专业的{role}，专注于完成当前任务。请遵循以下原则：
-
-**执行原则：**
-1. 使用可用的工具来完成任务
-2. 每轮执行后评估是否完成
-3. 如果任务完成，明确说明完成状态和交付物
-4. 如果任务未完成，说明下一步计划和所需信息
-5. 保持专业性和效率性
-
-**任务完成标识：**
-当任务完成时，请明确说明：
-- 任务完成状态（完成/部分完成/需要更多信息）
-- 主要交付物和成果
-- 下一步建议或注意事项
-"""
+        return "".join((_SYSTEM_REMINDER_HEAD, role, _SYSTEM_REMINDER_TAIL))
+    
+    def get_cache_key(self, request: 'PromptBuildRequest'):
+        """按角色及参与渲染的配置字段缓存，规则列表被修改后不会命中旧内容"""
+        
+        role_config = request.role_config
+        capabilities = getattr(role_config, 'capabilities', None)
+        key = (
+            request.role,
+            _as_key(getattr(role_config, 'behavior_rules', None)),
+            _as_key(getattr(role_config, 'quality_gates', None)),
+            _as_key(getattr(role_config, 'success_criteria', None)),
+            _as_key(getattr(capabilities, 'output_types', None)),
+            _as_key(getattr(capabilities, 'deliverable_formats', None)),
+            getattr(capabilities, 'average_execution_time', None)
+        )
+        
+        try:
+            hash(key)
+        except TypeError:
+            # 配置中含不可哈希的条目时不缓存
+            return None
+        return key
     
     def get_section_name(self) -> str:
         """获取section名称"""
@@ -5,7 +5,7 @@ Tool Builder
 """
 
 import structlog
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Hashable, Optional
 
 from .base_builder import BasePromptBuilder
 
@@ -14,13 +14,42 @@ if TYPE_CHECKING:
 
 logger = structlog.get_logger(__name__)
 
+# 默认工具信息
+_DEFAULT_TOOL_INFO = {
+    "file_operations": {
+        "category": "文件操作",
+        "description": "支持文件读取、写入、删除等操作"
+    },
+    "code_analysis": {
+        "category": "代码分析", 
+        "description": "支持语法检查、依赖分析、代码质量评估"
+    },
+    "testing_tools": {
+        "category": "测试工具",
+        "description": "支持单元测试、集成测试、性能测试"
+    },
+    "git_operations": {
+        "category": "版本控制",
+        "description": "支持Git提交、分支、合并等操作"
+    },
+    "user_question": {
+        "category": "用户交互",
+        "description": "支持获取用户确认和反馈"
+    },
+    "web_search": {
+        "category": "信息检索",
+        "description": "支持网络搜索和信息收集"
+    },
+    "documentation": {
+        "category": "文档处理",
+        "description": "支持文档生成、格式化、转换"
+    }
+}
+
 
 class ToolBuilder(BasePromptBuilder):
     """工具构建器"""
     
-    def __init__(self):
-        pass
-    
     async def build(self, request: 'PromptBuildRequest') -> str:
         """构建工具能力section"""
         
@@ -30,86 +59,44 @@ class ToolBuilder(BasePromptBuilder):
             if not available_tools:
                 return "## 可用工具能力\n当前没有可用的工具。"
             
-            # 获取详细工具信息
-            tools_info = await self._get_tools_detailed_info(available_tools)
-            
-            # 构建工具section
-            tools_section = "## 可用工具能力\n"
-            
+            # 构建工具section：工具信息为同步字典查找，一次join完成
+            tool_lines = []
             for tool_name in available_tools:
-                tool_info = tools_info.get(tool_name, {})
-                category = tool_info.get('category', '通用')
-                description = tool_info.get('description', f'{tool_name} 工具')
-                
-                tools_section += f"- **{tool_name}** ({category}): {description}\n"
+                tool_info = self._get_default_tool_info(tool_name)
+                tool_lines.append(f"- **{tool_name}** ({tool_info['category']}): {tool_info['description']}\n")
             
             # 添加工具调用格式规范
-            tools_section += self._get_tool_format_specification()
+            tools_section = "".join((
+                "## 可用工具能力\n",
+                "".join(tool_lines),
+                self._get_tool_format_specification()
+            )).strip()
             
             logger.debug(f"构建工具section完成，包含 {len(available_tools)} 个工具")
-            return tools_section.strip()
+            return tools_section
             
         except Exception as e:
             logger.error(f"构建工具section失败: {e}")
             # 降级处理
             return await self._build_basic_tools_section(request.available_tools)
     
-    async def _get_tools_detailed_info(self, tool_names: list[str]) -> dict[str, dict]:
-        """获取工具详细信息"""
-        
-        tools_info = {}
+    def get_cache_key(self, request: 'PromptBuildRequest') -> Optional[Hashable]:
+        """工具section只取决于工具列表；列表不变时各轮迭代复用同一字符串，保证prompt前缀逐字节一致"""
         
-        try:
-            # 直接使用默认描述，简化实现
-            for tool_name in tool_names:
-                tools_info[tool_name] = self._get_default_tool_info(tool_name)
-        
-        except Exception as e:
-            logger.warning(f"获取工具详细信息失败: {e}")
-            # 使用默认信息
-            for tool_name in tool_names:
-                tools_info[tool_name] = self._get_default_tool_info(tool_name)
-        
-        return tools_info
+        if request.available_tools is None:
+            return None
+        return tuple(request.available_tools)
     
     def _get_default_tool_info(self, tool_name: str) -> dict[str, str]:
         """获取默认工具信息"""
         
-        default_descriptions = {
-            "file_operations": {
-                "category": "文件操作",
-                "description": "支持文件读取、写入、删除等操作"
-            },
-            "code_analysis": {
-                "category": "代码分析", 
-                "description": "支持语法检查、依赖分析、代码质量评估"
-            },
-            "testing_tools": {
-                "category": "测试工具",
-                "description": "支持单元测试、集成测试、性能测试"
-            },
-            "git_operations": {
-                "category": "版本控制",
-                "description": "支持Git提交、分支、合并等操作"
-            },
-            "user_question": {
-                "category": "用户交互",
-                "description": "支持获取用户确认和反馈"
-            },
-            "web_search": {
-                "category": "信息检索",
-                "description": "支持网络搜索和信息收集"
-            },
-            "documentation": {
-                "category": "文档处理",
-                "description": "支持文档生成、格式化、转换"
+        tool_info = _DEFAULT_TOOL_INFO.get(tool_name)
+        if tool_info is None:
+            return {
+                "category": "通用工具",
+                "description": f"{tool_name} 工具"
             }
-        }
-        
-        return default_descriptions.get(tool_name, {
-            "category": "通用工具",
-            "description": f"{tool_name} 工具"
-        })
+        return tool_info
     
     def _get_tool_format_specification(self) -> str:
         """获取工具调用格式规范"""
@@ -4,7 +4,9 @@ Runtime Prompt Manager
 运行时prompt管理器 - 动态构建和组装运行时prompt
 """
 
-from typing import Dict, List, Optional, Any
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Any, Tuple
 import structlog
 
 from models.base import ExecutionContext, ExecutionState
@@ -23,10 +25,48 @@ from .processors.context_processor import ContextProcessor
 
 logger = structlog.get_logger(__name__)
 
+# section缓存上限
+_SECTION_CACHE_SIZE = 256
+
+# section顺序：跨迭代不变的section在前，构成稳定前缀，
+# 每轮变化的上下文和状态在后，服务端前缀缓存只需重新处理变化的尾部
+_SECTION_ORDER = (
+    'role_identity',
+    'tools',
+    'guidance',
+    'context',
+    'state'
+)
+
+# prompt结构校验时必须出现的section标题
+_REQUIRED_SECTION_TITLES = ('角色身份', '执行上下文', '可用工具', '执行状态')
+
+# 执行开始指令
+_START_INSTRUCTION = """
+## 开始执行
+基于以上完整信息，请开始执行你的专业任务。
+"""
+
+# 降级prompt骨架
+_FALLBACK_PROMPT_TEMPLATE = """
+{role_template}
+
+## 可用工具
+{tool_list}
+
+## 开始执行
+请开始执行你的任务。
+"""
+
 
 class RuntimePromptManager:
     """运行时prompt管理器 - core模块的独立组件"""
     
+    __slots__ = (
+        "role_prompt_manager", "template_manager", "reminder_engine",
+        "context_processor", "builders", "_sorted_builders", "_section_cache"
+    )
+    
     def __init__(self):
         # 依赖静态资源管理器
         self.role_prompt_manager = RolePromptManager()
@@ -39,6 +79,13 @@ class RuntimePromptManager:
         # 初始化构建器
         self.builders = self._initialize_builders()
         
+        # 构建器按优先级排序一次，每次构建直接遍历
+        self._sorted_builders = sorted(self.builders.items(), key=lambda x: x[1].get_priority())
+        
+        # (section名称, 构建器缓存键) -> 已构建的section内容，按LRU淘汰；
+        # 每轮变化的上下文不缓存，角色身份和系统指导等在输入不变时直接复用
+        self._section_cache: "OrderedDict[Tuple[str, Hashable], str]" = OrderedDict()
+        
         logger.info("RuntimePromptManager初始化完成")
     
     def _initialize_builders(self) -> Dict[str, BasePromptBuilder]:
@@ -59,24 +106,25 @@ class RuntimePromptManager:
         try:
             logger.info(f"开始构建角色 {request.role} 的完整prompt")
             
-            # 1. 按优先级顺序构建各个section
+            # 1. 各section之间没有数据依赖，并发构建后按优先级顺序收集
             sections = {}
             
-            # 获取构建器并按优先级排序
-            sorted_builders = sorted(
-                self.builders.items(),
-                key=lambda x: x[1].get_priority()
+            results = await asyncio.gather(
+                *(self._build_section_cached(section_name, builder, request)
+                  for section_name, builder in self._sorted_builders),
+                return_exceptions=True
             )
             
-            for section_name, builder in sorted_builders:
-                try:
-                    section_content = await builder.build(request)
-                    if section_content and section_content.strip():
-                        sections[section_name] = section_content
-                        logger.debug(f"构建section完成: {section_name}")
-                except Exception as e:
-                    logger.error(f"构建section失败 {section_name}: {e}")
-                    # 继续构建其他section
+            for (section_name, _), section_content in zip(self._sorted_builders, results):
+                if isinstance(section_content, BaseException):
+                    if not isinstance(section_content, Exception):
+                        raise section_content
+                    logger.error(f"构建section失败 {section_name}: {section_content}")
+                    # 继续收集其他section
+                    continue
+                if section_content and section_content.strip():
+                    sections[section_name] = section_content
+                    logger.debug(f"构建section完成: {section_name}")
             
             # 2. 添加自定义sections
             if request.custom_sections:
@@ -93,6 +141,25 @@ class RuntimePromptManager:
             # 返回基础prompt作为降级方案
             return await self._build_fallback_prompt(request)
     
+    async def _build_section_cached(self, section_name: str, builder: BasePromptBuilder, request: PromptBuildRequest) -> str:
+        """构建section，构建器提供缓存键时复用已构建的内容"""
+        
+        builder_key = builder.get_cache_key(request)
+        if builder_key is None:
+            return await builder.build(request)
+        
+        cache_key = (section_name, builder_key)
+        cached_content = self._section_cache.get(cache_key)
+        if cached_content is not None:
+            self._section_cache.move_to_end(cache_key)
+            return cached_content
+        
+        section_content = await builder.build(request)
+        self._section_cache[cache_key] = section_content
+        if len(self._section_cache) > _SECTION_CACHE_SIZE:
+            self._section_cache.popitem(last=False)
+        return section_content
+    
     async def build_section(self, section_type: str, request: PromptBuildRequest) -> str:
         """构建特定section"""
         
@@ -123,8 +190,7 @@ class RuntimePromptManager:
         }
         
         # 检查必要的sections
-        required_sections = ['角色身份', '执行上下文', '可用工具', '执行状态']
-        for section in required_sections:
+        for section in _REQUIRED_SECTION_TITLES:
             if section in prompt:
                 validation_result['sections_found'].append(section)
             else:
@@ -142,32 +208,17 @@ class RuntimePromptManager:
     async def _assemble_final_prompt(self, sections: Dict[str, str]) -> str:
         """组装最终prompt"""
         
-        # 定义section顺序
-        section_order = [
-            'role_identity',
-            'context', 
-            'tools',
-            'state',
-            'guidance'
-        ]
-        
         # 按顺序组装
-        prompt_parts = []
-        
-        for section_name in section_order:
-            if section_name in sections and sections[section_name]:
-                prompt_parts.append(sections[section_name])
+        prompt_parts = [sections[name] for name in _SECTION_ORDER if sections.get(name)]
         
         # 添加其他自定义sections
-        for section_name, content in sections.items():
-            if section_name not in section_order and content:
-                prompt_parts.append(content)
+        prompt_parts.extend(
+            content for section_name, content in sections.items()
+            if section_name not in _SECTION_ORDER and content
+        )
         
         # 添加执行开始指令
-        prompt_parts.append("""
-## 开始执行
-基于以上完整信息，请开始执行你的专业任务。
-""")
+        prompt_parts.append(_START_INSTRUCTION)
         
         return "\n\n".join(prompt_parts).strip()
     
@@ -176,14 +227,9 @@ class RuntimePromptManager:
         
         logger.warning(f"使用降级prompt构建方案")
         
-        fallback_prompt = f"""
-{request.role_config.prompt_template}
-
-## 可用工具
-{', '.join(request.available_tools) if request.available_tools else '当前没有可用的工具'}
-
-## 开始执行
-请开始执行你的任务。
-"""
+        fallback_prompt = _FALLBACK_PROMPT_TEMPLATE.format_map({
+            'role_template': request.role_config.prompt_template,
+            'tool_list': ', '.join(request.available_tools) if request.available_tools else '当前没有可用的工具'
+        })
         
         return fallback_prompt.strip()
@@ -252,6 +252,7 @@ class IsolatedRoleContext(BaseModel):
     last_updated: datetime = Field(default_factory=datetime.now, description="最后更新时间")
     is_compressed: bool = Field(default=False, description="是否已压缩")
     compression_ratio: Optional[float] = Field(None, description="压缩比例")
+    revision: int = Field(default=0, description="修改版本号，每次更新段落时递增")
     
     # 工具和权限
     available_tools: List[str] = Field(default_factory=list, description="可用工具")
@@ -296,6 +297,7 @@ class IsolatedRoleContext(BaseModel):
             )
         
         self.last_updated = datetime.now()
+        self.revision += 1
     
     def get_total_content_length(self) -> int:
         """获取总内容长度"""
@@ -719,6 +721,7 @@ class ExecutionConfig:
     max_iterations: int = 10  # 最大执行轮数
     max_tool_calls_per_iteration: int = 5  # 每轮最大工具调用数
     parallel_tool_execution: bool = True  # 是否并行执行工具
+    streaming_llm: bool = True  # 是否流式调用LLM（流式在产生输出前失败时退回ainvoke）
     context_compression_threshold: float = 0.8  # 上下文压缩阈值
     quality_threshold: float = 0.85  # 质量阈值
 
@@ -734,6 +737,27 @@ class AgentEnvironment:
     iteration_count: int = 0
     quality_score: float = 0.0
     last_response: Optional[str] = None
+    terminate_hint: bool = False  # 工具结果声明可以结束执行
+    # 上下文序列化长度缓存：context被替换、隔离上下文版本号变化或标记修改后重新计算
+    _context_len: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+    _context_len_source: Any = field(default=None, init=False, repr=False, compare=False)
+    _context_len_revision: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def context_len(self) -> int:
+        """上下文序列化后的长度，上下文未变化时直接返回缓存值"""
+        revision = getattr(getattr(self.context, 'isolated_context', None), 'revision', None)
+        if (self._context_len is None
+                or self._context_len_source is not self.context
+                or self._context_len_revision != revision):
+            self._context_len = len(str(self.context))
+            self._context_len_source = self.context
+            self._context_len_revision = revision
+        return self._context_len
+    
+    def mark_context_changed(self):
+        """原地修改context后调用，使缓存的上下文长度失效"""
+        self._context_len = None
 
 
 @dataclass
@@ -0,0 +1,205 @@
+"""
+AgentRunner 流式解析与工具调度测试
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import tools.llm
+from core.execution import agent_runner
+from core.execution.agent_runner import AgentRunner, StreamingToolCallParser
+
+
+def _call_json(name, **parameters):
+    return json.dumps({"tool_name": name, "parameters": parameters})
+
+
+class _FakeToolManager:
+    """记录执行顺序的工具管理器"""
+
+    def __init__(self, concurrency_safe=()):
+        self.concurrency_safe = set(concurrency_safe)
+        self.executed = []
+
+    async def get_available_tools(self):
+        return [
+            {"name": name, "is_concurrency_safe": True}
+            for name in self.concurrency_safe
+        ]
+
+    async def execute_tool(self, tool_name, parameters, context):
+        self.executed.append(tool_name)
+        return SimpleNamespace(success=True, result="ok", error=None, execution_time=0.0, metadata={})
+
+    async def execute_tools_batch(self, tool_calls, context):
+        return [
+            await self.execute_tool(call["tool_name"], call["parameters"], context)
+            for call in tool_calls
+        ]
+
+
+class _FakeLLM:
+    """按chunk流式输出固定文本，可在指定位置抛出异常"""
+
+    def __init__(self, chunks, fail_at=None):
+        self.chunks = chunks
+        self.fail_at = fail_at
+        self.ainvoke_calls = 0
+
+    async def astream(self, prompt):
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_at:
+                raise RuntimeError("stream broken")
+            yield chunk
+            # 让出事件循环，已派发的工具可以在下一个chunk到达前开始执行
+            await asyncio.sleep(0)
+        if self.fail_at == len(self.chunks):
+            raise RuntimeError("stream broken")
+
+    async def ainvoke(self, prompt):
+        self.ainvoke_calls += 1
+        return "".join(self.chunks)
+
+
+@pytest.fixture
+def make_runner(monkeypatch):
+    def make(llm, tool_manager):
+        monkeypatch.setattr(tools.llm, "get_llm_for_scene", lambda scene: llm)
+        monkeypatch.setattr(agent_runner, "get_tool_manager", lambda: tool_manager)
+        runner = AgentRunner()
+
+        async def build_prompt(agent_env, iteration):
+            return "prompt"
+
+        runner._build_prompt_with_manager = build_prompt
+        return runner
+
+    return make
+
+
+def _agent_env():
+    return SimpleNamespace(context={}, available_tools=[], quality_score=0.0, terminate_hint=False)
+
+
+def _feed_all(parser, chunks):
+    calls = []
+    for chunk in chunks:
+        calls.extend(parser.feed(chunk))
+    return calls + parser.finish()
+
+
+def test_streaming_parser_handles_objects_split_across_chunks():
+    text = "先读取文件 " + _call_json("file_read", path="/a/{b}.txt") + " 然后 " + _call_json("grep", pattern="x")
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    parser = StreamingToolCallParser()
+    first = []
+    for chunk in chunks:
+        first.extend(parser.feed(chunk))
+        if first:
+            break
+
+    # 第一个对象闭合即产出，不必等待流结束
+    assert [call.name for call in first] == ["file_read"]
+    assert first[0].arguments == {"path": "/a/{b}.txt"}
+
+
+@pytest.mark.asyncio
+async def test_streaming_parser_matches_full_parse_for_nested_calls(make_runner):
+    text = (
+        'plan: {"steps": [' + _call_json("a") + ', {"inner": ' + _call_json("b") + '}]} '
+        + _call_json("c", nested={"tool_name": "not_a_call"})
+    )
+    chunks = [text[i:i + 5] for i in range(0, len(text), 5)]
+
+    streamed = _feed_all(StreamingToolCallParser(), chunks)
+    full = await make_runner(_FakeLLM([]), _FakeToolManager())._parse_structured_tool_calls(text)
+
+    assert [call.name for call in streamed] == ["a", "b", "c"]
+    assert streamed == full
+
+
+def test_streaming_parser_skips_unmatched_brace():
+    parser = StreamingToolCallParser()
+
+    assert parser.feed("用 { 表示集合，") == []
+    calls = parser.feed(_call_json("grep", pattern="x"))
+
+    assert [call.name for call in calls] == ["grep"]
+
+
+@pytest.mark.asyncio
+async def test_stream_failure_before_first_chunk_falls_back_to_ainvoke(make_runner):
+    llm = _FakeLLM([_call_json("grep", pattern="x")], fail_at=0)
+    tool_manager = _FakeToolManager()
+    runner = make_runner(llm, tool_manager)
+
+    result = await runner.run_iteration(_agent_env(), 1)
+
+    assert llm.ainvoke_calls == 1
+    assert [call.name for call in result.tool_calls] == ["grep"]
+    assert tool_manager.executed == ["grep"]
+
+
+@pytest.mark.asyncio
+async def test_stream_failure_after_output_does_not_reinvoke(make_runner):
+    llm = _FakeLLM([_call_json("grep", pattern="x"), " 继续"], fail_at=2)
+    tool_manager = _FakeToolManager(concurrency_safe=["grep"])
+    runner = make_runner(llm, tool_manager)
+
+    result = await runner.run_iteration(_agent_env(), 1)
+
+    assert llm.ainvoke_calls == 0
+    assert result.tool_calls == []
+    assert "执行错误" in result.completion_analysis.completion_reason
+    # 流中已派发的工具只执行一次，失败后不因改用ainvoke再执行
+    assert tool_manager.executed.count("grep") == 1
+
+
+@pytest.mark.asyncio
+async def test_streaming_runs_tools_once_in_call_order(make_runner):
+    text = _call_json("grep", pattern="x") + _call_json("file_write", path="/a")
+    llm = _FakeLLM([text[:10], text[10:]])
+    tool_manager = _FakeToolManager(concurrency_safe=["grep"])
+    runner = make_runner(llm, tool_manager)
+
+    result = await runner.run_iteration(_agent_env(), 1)
+
+    assert llm.ainvoke_calls == 0
+    assert [r.tool_call.name for r in result.tool_results] == ["grep", "file_write"]
+    assert sorted(tool_manager.executed) == ["file_write", "grep"]
+
+
+def _tool_call(name, **arguments):
+    return agent_runner.ToolCall(name=name, arguments=arguments, description="")
+
+
+def _waves(tool_calls):
+    return agent_runner._schedule_tool_waves(tool_calls, list(range(len(tool_calls))))
+
+
+def test_tool_waves_run_disjoint_resources_together():
+    calls = [_tool_call("write", path="/a/x"), _tool_call("write", path="/b/y"), _tool_call("fetch", url="http://h/a")]
+
+    assert _waves(calls) == [[0, 1, 2]]
+
+
+def test_tool_waves_serialize_shared_and_nested_resources():
+    calls = [
+        _tool_call("write", file_path="/a/b.txt"),
+        _tool_call("write", path="/a/./b.txt"),
+        _tool_call("list", directory="/a"),
+        _tool_call("write", file_path="/a/c/d.txt"),
+        _tool_call("write", file_path="/ab/e.txt")
+    ]
+
+    assert _waves(calls) == [[0, 4], [1], [2], [3]]
+
+
+def test_tool_waves_treat_unknown_resources_as_barrier():
+    calls = [_tool_call("write", path="/a"), _tool_call("shell"), _tool_call("write", path="/b")]
+
+    assert _waves(calls) == [[0], [1], [2]]
@@ -0,0 +1,56 @@
+"""
+PermissionManager 权限决策缓存测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core.execution.permission_manager import PermissionManager
+
+
+def _tool(category, name):
+    return SimpleNamespace(category=category, name=name)
+
+
+@pytest.mark.asyncio
+async def test_revoked_permission_is_denied_after_cached_grant():
+    manager = PermissionManager()
+    tool = _tool("web_services", "api_call")
+
+    granted = await manager.validate_tool_access("编码专家", tool, {})
+    assert granted["is_valid"]
+    assert manager.cache_misses == 1
+
+    await manager.validate_tool_access("编码专家", tool, {})
+    assert manager.cache_hits == 1
+
+    manager.update_role_permissions("编码专家", ["file_operations:*"])
+    denied = await manager.validate_tool_access("编码专家", tool, {})
+
+    assert not denied["is_valid"]
+    assert denied["error_code"] == "PERMISSION_DENIED"
+
+
+@pytest.mark.asyncio
+async def test_raised_security_level_applies_after_cached_decision():
+    manager = PermissionManager()
+    tool = _tool("web_services", "api_call")
+
+    granted = await manager.validate_tool_access("编码专家", tool, {})
+    assert granted["security_level"] == "medium"
+
+    manager.update_tool_security_level("web_services:api_call", "critical")
+    denied = await manager.validate_tool_access("编码专家", tool, {})
+
+    assert not denied["is_valid"]
+    assert denied["error_code"] == "CRITICAL_TOOL_ACCESS_DENIED"
+
+
+@pytest.mark.parametrize("url", ["http://localhost./x", "https:foo", "http:/localhost"])
+def test_local_or_hostless_urls_are_rejected(url):
+    assert not PermissionManager()._is_safe_url(url)
+
+
+def test_public_url_is_accepted():
+    assert PermissionManager()._is_safe_url("https://example.com/docs")
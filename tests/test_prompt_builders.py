@@ -0,0 +1,48 @@
+"""
+Prompt构建器缓存测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core.prompt_manager import create_build_request, create_prompt_manager
+from core.prompt_manager.builders.guidance_builder import GuidanceBuilder
+
+
+def _request(role_config):
+    return create_build_request(
+        role="coding_expert",
+        role_config=role_config,
+        context=None,
+        execution_state=None,
+        available_tools=[]
+    )
+
+
+def _role_config(behavior_rules):
+    return SimpleNamespace(behavior_rules=behavior_rules, capabilities=None)
+
+
+@pytest.mark.asyncio
+async def test_guidance_cache_misses_after_rules_change():
+    manager = create_prompt_manager()
+    builder = GuidanceBuilder()
+    role_config = _role_config(["规则一"])
+
+    first = await manager._build_section_cached("guidance", builder, _request(role_config))
+    role_config.behavior_rules.append("规则二")
+    second = await manager._build_section_cached("guidance", builder, _request(role_config))
+
+    assert "规则二" not in first
+    assert "规则二" in second
+
+
+def test_guidance_cache_key_is_equal_for_equal_configs():
+    builder = GuidanceBuilder()
+
+    first = builder.get_cache_key(_request(_role_config(["规则一"])))
+    second = builder.get_cache_key(_request(_role_config(["规则一"])))
+
+    assert first == second
+    assert builder.get_cache_key(_request(_role_config([{"rule": "x"}]))) is None
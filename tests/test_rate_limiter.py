@@ -0,0 +1,64 @@
+"""
+RateLimiter 使用跟踪测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core.execution import rate_limiter
+from core.execution.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的单调时钟"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+    return now
+
+
+def test_limiter_can_be_created_without_running_loop():
+    limiter = RateLimiter()
+
+    assert limiter.check_rate_limit("coding_expert", "file_operations", "read_file")
+
+
+def test_expired_key_is_removed_on_access(clock):
+    limiter = RateLimiter()
+    key = ("coding_expert", "file_operations", "read_file")
+
+    assert limiter.check_rate_limit(*key)
+    clock[0] += 61
+
+    assert limiter.get_remaining_quota(*key)["used"] == 0
+    assert key not in limiter.usage_tracking
+
+    assert limiter.check_rate_limit(*key)
+    assert len(limiter.usage_tracking[key]) == 1
+
+
+def test_idle_keys_are_swept_from_statistics(clock):
+    limiter = RateLimiter()
+    limiter.check_rate_limit("coding_expert", "file_operations", "read_file")
+    clock[0] += 30
+    limiter.check_rate_limit("coding_expert", "web_services", "fetch")
+    clock[0] += 40
+
+    stats = limiter.get_usage_statistics()
+
+    assert list(stats) == ["web_services"]
+    assert list(limiter.usage_tracking) == [("coding_expert", "web_services", "fetch")]
+
+
+def test_tracked_keys_are_capped_by_lru(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_MAX_TRACKED_KEYS", 2)
+    limiter = RateLimiter()
+
+    limiter.check_rate_limit("role", "default", "a")
+    limiter.check_rate_limit("role", "default", "b")
+    clock[0] += 2
+    limiter.check_rate_limit("role", "default", "a")
+    limiter.check_rate_limit("role", "default", "c")
+
+    assert [key[2] for key in limiter.usage_tracking] == ["a", "c"]
@@ -0,0 +1,146 @@
+"""
+ToolExecutor 执行统计测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.execution.mcptools.executor import ToolExecutor
+
+
+class _FakeRegistry:
+    """只提供执行器所需接口的工具注册表"""
+
+    def __init__(self):
+        self.registered_tools = {
+            "echo": SimpleNamespace(server_name="builtin"),
+            "broken": SimpleNamespace(server_name="builtin"),
+            "slow": SimpleNamespace(server_name="builtin"),
+            "socket": SimpleNamespace(server_name="builtin")
+        }
+
+    async def execute_tool(self, tool_name, parameters):
+        if tool_name == "slow":
+            await asyncio.sleep(1)
+        if tool_name == "socket":
+            raise TimeoutError("socket timed out")
+        if tool_name == "broken":
+            return SimpleNamespace(success=False, result=None, error="boom", metadata=None)
+        return {"echo": parameters}
+
+
+@pytest.mark.asyncio
+async def test_successful_call_updates_stats_and_history():
+    executor = ToolExecutor(_FakeRegistry())
+
+    result = await executor.execute_single_tool("echo", {"text": "hi"}, {"role": "coding_expert"})
+
+    assert result.success
+
+    stats = executor.get_execution_stats()
+    assert stats["total_calls"] == 1
+    assert stats["successful_calls"] == 1
+    assert stats["failed_calls"] == 0
+    assert stats["tools_stats"]["echo"]["total_calls"] == 1
+
+    history = executor.get_execution_history()
+    assert len(history) == 1
+    assert history[0].server_name == "builtin"
+    assert history[0].role == "coding_expert"
+
+
+@pytest.mark.asyncio
+async def test_failed_result_counts_as_failure():
+    executor = ToolExecutor(_FakeRegistry())
+
+    result = await executor.execute_single_tool("broken", {}, {"role": "coding_expert"})
+
+    assert not result.success
+
+    stats = executor.get_execution_stats()
+    assert stats["successful_calls"] == 0
+    assert stats["failed_calls"] == 1
+
+    history = executor.get_execution_history()
+    assert not history[0].success
+    assert history[0].error == "boom"
+
+
+@pytest.mark.asyncio
+async def test_slow_tool_times_out():
+    executor = ToolExecutor(_FakeRegistry())
+
+    result = await executor.execute_single_tool("slow", {}, timeout=0.01)
+
+    assert not result.success
+    assert result.metadata["timeout"] == 0.01
+    assert executor.get_execution_stats()["failed_calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tool_raised_timeout_is_not_reported_as_executor_timeout():
+    executor = ToolExecutor(_FakeRegistry())
+
+    result = await executor.execute_single_tool("socket", {})
+
+    assert not result.success
+    assert result.error == "socket timed out"
+    assert "timeout" not in result.metadata
+
+
+class _RecordingRegistry:
+    """记录工具执行顺序的工具注册表"""
+
+    def __init__(self):
+        self.registered_tools = {}
+        self.executed = []
+
+    async def execute_tool(self, tool_name, parameters):
+        self.executed.append(tool_name)
+        return {"tool": tool_name}
+
+
+def _call(name, *dependencies):
+    return {"tool_name": name, "parameters": {}, "dependencies": list(dependencies) or None}
+
+
+async def _run_calls(tool_calls):
+    registry = _RecordingRegistry()
+    executor = ToolExecutor(registry)
+    strategy = executor._analyze_execution_strategy(executor._convert_to_tool_calls(tool_calls))
+    results = await executor.execute_tool_calls(tool_calls)
+    return strategy, results, registry.executed
+
+
+@pytest.mark.asyncio
+async def test_dependency_chain_runs_level_by_level():
+    strategy, results, executed = await _run_calls([_call("c", "b"), _call("b", "a"), _call("a")])
+
+    assert strategy.levels == [[2], [1], [0]]
+    assert executed == ["a", "b", "c"]
+    assert [result.tool_name for result in results] == ["c", "b", "a"]
+
+
+@pytest.mark.asyncio
+async def test_dependency_diamond_runs_middle_level_together():
+    strategy, results, executed = await _run_calls(
+        [_call("d", "b", "c"), _call("b", "a"), _call("c", "a"), _call("a")]
+    )
+
+    assert strategy.levels == [[3], [1, 2], [0]]
+    assert executed[0] == "a"
+    assert sorted(executed[1:3]) == ["b", "c"]
+    assert executed[3] == "d"
+    assert [result.tool_name for result in results] == ["d", "b", "c", "a"]
+
+
+@pytest.mark.asyncio
+async def test_dependency_cycle_falls_back_to_serial_order():
+    strategy, results, executed = await _run_calls([_call("b", "c"), _call("a"), _call("c", "b")])
+
+    assert strategy.levels == [[1], [0], [2]]
+    assert executed == ["a", "b", "c"]
+    assert [result.tool_name for result in results] == ["b", "a", "c"]
+    assert all(result.success for result in results)
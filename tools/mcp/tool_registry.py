@@ -29,6 +29,9 @@ class MCPToolRegistry:
         self.config_file_path = config_file_path
         self.registered_tools: Dict[str, MCPToolDefinition] = {}
         
+        # 注册表版本号，每次注册/注销工具时递增，供调用方判断缓存是否失效
+        self.version: int = 0
+        
         # MCP服务管理器实例（将在initialize中初始化）
         self.builtin_manager = None
         self.configurable_manager = None
@@ -176,6 +179,7 @@ class MCPToolRegistry:
                 logger.warning(f"工具已存在，将覆盖: {tool.name}")
             
             self.registered_tools[tool.name] = tool
+            self.version += 1
             logger.info(f"MCP工具已注册: {tool.name}")
             return True
             
@@ -187,6 +191,7 @@ class MCPToolRegistry:
         """注销MCP工具"""
         if tool_name in self.registered_tools:
             del self.registered_tools[tool_name]
+            self.version += 1
             logger.info(f"MCP工具已注销: {tool_name}")
             return True
         return False